@@ -15,6 +15,30 @@ fi
 
 fi
 
+if [ "$ENABLE_IMPORT_WORKER" == "True" ];
+then
+echo "Starting Import Worker"
+python /app/manage.py import_worker_command >> /app/logs/import_worker_command.log 2>&1 &
+status=$?
+if [ $status -ne 0 ]; then
+  echo "Failed to start import worker: $status"
+  exit $status
+fi
+
+fi
+
+if [ "$ENABLE_IMPORT_WATCHER" == "True" ];
+then
+echo "Starting Import Watcher"
+python /app/manage.py watch_imports_command >> /app/logs/watch_imports_command.log 2>&1 &
+status=$?
+if [ $status -ne 0 ]; then
+  echo "Failed to start import watcher: $status"
+  exit $status
+fi
+
+fi
+
 if [ $ENABLE_WEB == "True" ];
     then
 echo "Starting Gunicorn"
@@ -0,0 +1,172 @@
+"""
+Reading flight inputs straight from the uploaded archive.
+
+Instead of extracting the whole upload before processing, the pipeline can read
+the PNGs and KML through GDAL's archive virtual filesystems (/vsizip/ for .zip,
+/vsi7z/ for .7z with GDAL >= 3.7). Input paths are then GDAL paths such as
+/vsizip//data/history/FireFlight_x.20240101.zip/FireFlight_x/PNGs/CAMERA1/0001.png,
+and the helpers below list, stat and read them whether they are inside an
+archive or on the local filesystem.
+
+When the archive is extracted, it can also be limited to the members the
+pipeline actually reads (see REQUIRED_MEMBERS), with zip members extracted by
+a thread pool; uploads carry other cameras and ancillary data we never touch.
+"""
+import os
+import re
+import time
+import logging
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+import py7zr
+from osgeo import gdal
+
+logger = logging.getLogger(__name__)
+
+gdal.UseExceptions()
+
+VSI_PREFIXES = {
+    ".zip": "/vsizip/",
+    ".7z": "/vsi7z/",
+}
+
+
+def is_vsi_path(path):
+    return path.startswith("/vsi")
+
+
+def get_archive_root(archive_path, inner_folder=""):
+    """
+    Returns the GDAL path of inner_folder inside the archive, or None if the archive format is not supported.
+    """
+    prefix = VSI_PREFIXES.get(os.path.splitext(archive_path)[1].lower())
+    if prefix is None:
+        return None
+    root = prefix + os.path.abspath(archive_path)
+    return root + "/" + inner_folder if inner_folder else root
+
+
+def path_exists(path):
+    if not is_vsi_path(path):
+        return os.path.exists(path)
+    # Folders inside an archive are often implicit (no entry of their own), so also try listing them
+    return gdal.VSIStatL(path) is not None or bool(gdal.ReadDir(path))
+
+
+def list_dir(path):
+    """
+    Returns the names of the entries of a folder, like os.listdir, or an empty list if it cannot be read.
+    """
+    if not is_vsi_path(path):
+        return os.listdir(path)
+    return [name for name in (gdal.ReadDir(path) or []) if name not in (".", "..")]
+
+
+def stat_file(path):
+    """
+    Returns (mtime, size) of a file. Inside an archive these are the member's modification time and uncompressed size.
+    """
+    if not is_vsi_path(path):
+        stat = os.stat(path)
+        return stat.st_mtime, stat.st_size
+    stat = gdal.VSIStatL(path)
+    if stat is None:
+        raise FileNotFoundError(f"No such file in archive: {path}")
+    return stat.mtime, stat.size
+
+
+def iter_file_chunks(path, chunk_size=8 * 1024 * 1024):
+    """
+    Yields the content of a file in chunks.
+    """
+    if not is_vsi_path(path):
+        with open(path, 'rb') as f:
+            yield from iter(lambda: f.read(chunk_size), b'')
+        return
+    f = gdal.VSIFOpenL(path, 'rb')
+    if f is None:
+        raise FileNotFoundError(f"No such file in archive: {path}")
+    try:
+        while True:
+            chunk = gdal.VSIFReadL(1, chunk_size, f)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        gdal.VSIFCloseL(f)
+
+
+# Archive members read by the pipeline, relative to the archive root (<flight folder>/...).
+# The PNGs are georeferenced by their sidecars (world files, .png.aux.xml), which GDAL reads next to them.
+REQUIRED_MEMBERS = [
+    re.compile(r"^[^/]+/PNGs/CAMERA1/[^/]+\.(png|pgw|pngw|wld)$", re.IGNORECASE),
+    re.compile(r"^[^/]+/PNGs/CAMERA1/[^/]+\.png\.aux\.xml$", re.IGNORECASE),
+    re.compile(r"^[^/]+/KML Boundaries/CAMERA1/[^/]+bnd\.kml$", re.IGNORECASE),
+]
+
+
+def is_required_member(name):
+    name = name.replace("\\", "/")
+    return any(pattern.match(name) for pattern in REQUIRED_MEMBERS)
+
+
+class ExtractionResult:
+    def __init__(self, files=0, bytes=0, skipped=0, seconds=0.0):
+        self.files = files
+        self.bytes = bytes
+        self.skipped = skipped
+        self.seconds = seconds
+
+    def summary(self):
+        return (
+            f"{self.files} file(s), {self.bytes / (1024 * 1024):.1f} MB extracted in {self.seconds:.1f}s, "
+            f"{self.skipped} member(s) skipped"
+        )
+
+
+def _extract_zip_members(archive_path, names, dest_folder):
+    # One ZipFile per thread: members are then read and inflated independently
+    with zipfile.ZipFile(archive_path) as archive:
+        for name in names:
+            archive.extract(name, dest_folder)
+
+
+def extract_required_members(archive_path, dest_folder, workers=4):
+    """
+    Extracts only the archive members matching REQUIRED_MEMBERS into dest_folder.
+    Zip members are extracted in parallel; 7z members in one py7zr pass (which decompresses
+    independent blocks in parallel). Returns an ExtractionResult.
+    """
+    start = time.monotonic()
+    result = ExtractionResult()
+    extension = os.path.splitext(archive_path)[1].lower()
+
+    if extension == ".zip":
+        with zipfile.ZipFile(archive_path) as archive:
+            members = [info for info in archive.infolist() if not info.is_dir()]
+        selected = [info for info in members if is_required_member(info.filename)]
+        result.bytes = sum(info.file_size for info in selected)
+        names = [info.filename for info in selected]
+        # Create the folders first, so the threads do not race creating the same ones
+        for folder in {os.path.dirname(name) for name in names}:
+            os.makedirs(os.path.join(dest_folder, folder), exist_ok=True)
+        # Interleaved batches, so each thread gets a similar share of the (similarly sized) PNGs
+        workers = max(1, min(workers, len(names)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(lambda batch: _extract_zip_members(archive_path, batch, dest_folder),
+                              [names[i::workers] for i in range(workers)]))
+    elif extension == ".7z":
+        with py7zr.SevenZipFile(archive_path, mode='r') as archive:
+            members = [info for info in archive.list() if not info.is_directory]
+            selected = [info for info in members if is_required_member(info.filename)]
+            result.bytes = sum(info.uncompressed for info in selected)
+            names = [info.filename for info in selected]
+            if names:
+                archive.extract(path=dest_folder, targets=names)
+    else:
+        raise ValueError(f"Unsupported archive format: {archive_path}")
+
+    result.files = len(selected)
+    result.skipped = len(members) - len(selected)
+    result.seconds = time.monotonic() - start
+    return result
@@ -0,0 +1,62 @@
+"""
+Resident, spatially indexed district lookup.
+
+The districts layer is loaded once per process, its geometries are prepared and
+put in an STRtree, and it is only reloaded when the GeoPackage's mtime changes.
+Resolving the districts of a footprint is then an in-memory index query.
+"""
+import os
+import logging
+import threading
+import geopandas as gpd
+import shapely
+
+logger = logging.getLogger(__name__)
+
+
+class DistrictLookup:
+    def __init__(self, gpkg_path, layer_name):
+        self.gpkg_path = gpkg_path
+        self.layer_name = layer_name
+        self.mtime = None
+        # (names, geometries, tree), swapped in as a whole so concurrent queries never see a half-loaded layer
+        self.index = ([], None, None)
+        self._lock = threading.Lock()
+
+    def _load_if_changed(self):
+        mtime = os.path.getmtime(self.gpkg_path)
+        if mtime == self.mtime:
+            return
+        with self._lock:
+            if mtime == self.mtime:
+                return
+            logger.info(f"Loading districts layer '{self.layer_name}' from: {self.gpkg_path}")
+            districts_gdf = gpd.read_file(self.gpkg_path, layer=self.layer_name)
+            geometries = districts_gdf.geometry.to_numpy()
+            shapely.prepare(geometries)
+            names = [name.strip().replace(" ", "_") for name in districts_gdf['ADMIN_ZONE']]
+            self.index = (names, geometries, shapely.STRtree(geometries))
+            self.mtime = mtime
+            logger.info(f"Loaded {len(names)} districts.")
+
+    def get_districts(self, geometry):
+        """
+        Returns the names of the districts intersecting the geometry, in the layer's order.
+        """
+        self._load_if_changed()
+        names, geometries, tree = self.index
+        indices = tree.query(geometry, predicate='intersects')
+        return [names[i] for i in sorted(indices.tolist())]
+
+
+# One lookup per districts layer, kept for the lifetime of the (worker) process
+_lookups = {}
+_lookups_lock = threading.Lock()
+
+
+def get_district_lookup(gpkg_path, layer_name):
+    key = (gpkg_path, layer_name)
+    with _lookups_lock:
+        if key not in _lookups:
+            _lookups[key] = DistrictLookup(gpkg_path, layer_name)
+        return _lookups[key]
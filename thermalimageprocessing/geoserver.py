@@ -0,0 +1,208 @@
+"""
+GeoServer REST publisher.
+
+Publishes GeoTIFFs as coverage stores and layers through a single keep-alive
+session (so the TLS handshake is paid once per connection, not once per call),
+with bounded concurrency and per-request timeouts. "Already exists" responses
+are treated as skipped rather than failed, and every batch reports how many
+items were published, skipped or failed.
+
+The hotspot images of a flight can also be published as a single ImageMosaic
+store over the flight's image directory (one layer per flight, with the image
+name as an attribute) instead of one coverage store and layer per image.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+PUBLISHED = "published"
+SKIPPED = "skipped"
+
+
+class GeoServerError(Exception):
+    pass
+
+
+class PublishResult:
+    def __init__(self):
+        self.published = []
+        self.skipped = []
+        self.failed = {}
+
+    def add(self, name, outcome):
+        if outcome == PUBLISHED:
+            self.published.append(name)
+        else:
+            self.skipped.append(name)
+
+    def summary(self):
+        return f"{len(self.published)} published, {len(self.skipped)} skipped (already existed), {len(self.failed)} failed"
+
+
+class GeoServerPublisher:
+    def __init__(self, coveragestores_url, file_url_base, user, password, workspace="hotspots", max_workers=8, timeout=(10, 120)):
+        """
+        coveragestores_url: REST URL of the workspace's coverage stores, e.g.
+            https://<host>/geoserver/rest/workspaces/hotspots/coveragestores/
+        file_url_base: URL of the GeoServer storage as seen by GeoServer, e.g.
+            file:///rclone-mounts/thermalimaging-flightmosaics/
+        timeout: (connect, read) timeout in seconds applied to every request
+        """
+        self.coveragestores_url = coveragestores_url if coveragestores_url.endswith('/') else coveragestores_url + '/'
+        self.file_url_base = file_url_base
+        self.workspace = workspace
+        self.max_workers = max(1, max_workers)
+        self.timeout = timeout
+
+        # Keep-alive connection pool sized for the concurrency, retrying only failed connection attempts
+        self.session = requests.Session()
+        self.session.auth = (user, password)
+        self.session.headers.update({'Content-type': 'application/xml'})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers, max_retries=2)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def close(self):
+        self.session.close()
+
+    def _post(self, url, data, what):
+        """
+        POSTs to GeoServer. Returns PUBLISHED when created, SKIPPED when it already exists, raises GeoServerError otherwise.
+        """
+        try:
+            response = self.session.post(url, data=data, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise GeoServerError(f"Request error while creating {what}: {e}") from e
+
+        if response.status_code in (200, 201):
+            return PUBLISHED
+        # Not strictly an error if we are updating or reprocessing
+        if response.status_code == 409 or (response.status_code == 500 and "already exists" in response.text):
+            return SKIPPED
+        raise GeoServerError(f"Failed to create {what}. Status: {response.status_code}, Response: {response.text}")
+
+    def publish_coverage(self, store_name, file_path, layer_name, srs="EPSG:28350"):
+        """
+        Creates a GeoTIFF coverage store for file_path (relative to file_url_base) and publishes its layer.
+        Returns PUBLISHED if the layer was created, SKIPPED if it already existed.
+        """
+        store_data = (
+            f'<coverageStore><name>{escape(store_name)}</name><workspace>{escape(self.workspace)}</workspace>'
+            f'<enabled>true</enabled><type>GeoTIFF</type><url>{escape(self.file_url_base + file_path)}</url></coverageStore>'
+        )
+        store_outcome = self._post(self.coveragestores_url, store_data, f"coverage store {store_name}")
+        logger.info(f"Coverage Store {store_name}: {store_outcome}.")
+
+        layer_data = f'<coverage><name>{escape(layer_name)}</name><title>{escape(layer_name)}</title><srs>{srs}</srs></coverage>'
+        layer_outcome = self._post(self.coveragestores_url + store_name + '/coverages', layer_data, f"layer {layer_name}")
+        logger.info(f"Layer {layer_name}: {layer_outcome}.")
+        return layer_outcome
+
+    def store_exists(self, store_name):
+        try:
+            response = self.session.get(self.coveragestores_url + store_name + '.json', timeout=self.timeout)
+        except requests.RequestException as e:
+            raise GeoServerError(f"Request error while looking up coverage store {store_name}: {e}") from e
+        if response.status_code == 200:
+            return True
+        if response.status_code == 404:
+            return False
+        raise GeoServerError(f"Failed to look up coverage store {store_name}. Status: {response.status_code}, Response: {response.text}")
+
+    def publish_image_mosaic(self, store_name, directory_path):
+        """
+        Creates an ImageMosaic store (and its layer) over directory_path (relative to file_url_base) with a PUT,
+        or, if the store already exists (reprocessed flight), harvests the directory into it with a POST, which
+        indexes the granules not indexed yet. Either way a single REST call whatever the number of images.
+        The directory must already hold the files from get_image_mosaic_config().
+        """
+        url = self.coveragestores_url + store_name + '/external.imagemosaic'
+        directory_url = self.file_url_base + directory_path
+        # A PUT on an existing store does not harvest new granules: only a POST does
+        harvest = self.store_exists(store_name)
+        try:
+            if harvest:
+                response = self.session.post(url, data=directory_url, headers={'Content-type': 'text/plain'}, timeout=self.timeout)
+            else:
+                response = self.session.put(
+                    url,
+                    data=directory_url,
+                    params={'configure': 'all'},
+                    headers={'Content-type': 'text/plain'},
+                    timeout=self.timeout,
+                )
+        except requests.RequestException as e:
+            raise GeoServerError(f"Request error while {'harvesting into' if harvest else 'creating'} ImageMosaic store {store_name}: {e}") from e
+
+        if response.status_code in (200, 201, 202):
+            logger.info(f"ImageMosaic store {store_name} {'harvested' if harvest else 'created'} over {directory_url}. (Status {response.status_code})")
+            return PUBLISHED
+        raise GeoServerError(
+            f"Failed to {'harvest into' if harvest else 'create'} ImageMosaic store {store_name}. "
+            f"Status: {response.status_code}, Response: {response.text}"
+        )
+
+    def publish_many(self, items):
+        """
+        Publishes (store_name, file_path, layer_name) items with bounded concurrency.
+        Returns a PublishResult; a failed item does not stop the others.
+        """
+        result = PublishResult()
+
+        def publish(item):
+            store_name, file_path, layer_name = item
+            try:
+                return layer_name, self.publish_coverage(store_name, file_path, layer_name), None
+            except GeoServerError as e:
+                return layer_name, None, str(e)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for layer_name, outcome, error in executor.map(publish, items):
+                if error is not None:
+                    logger.error(error)
+                    result.failed[layer_name] = error
+                else:
+                    result.add(layer_name, outcome)
+
+        logger.info(f"GeoServer publishing: {result.summary()}.")
+        return result
+
+
+def get_mosaic_item(flight_name):
+    # (store name, file path, layer name) of a flight mosaic
+    return (flight_name + '.tif', flight_name + '.tif', flight_name)
+
+
+def get_hotspot_image_item(flight_name, image_name):
+    # (store name, file path, layer name) of a hotspot image, e.g. image_name 00001.tif -> <timestamp>_img_00001
+    flight_timestamp = flight_name.replace("FireFlight_", "")
+    store_name = f"{flight_timestamp}_img_{image_name}"
+    return (store_name, f"{flight_name}_images/{image_name}", f"{flight_timestamp}_img_{image_name[:-4]}")
+
+
+def get_image_mosaic_name(flight_name):
+    # Store and layer name of the hotspot images ImageMosaic of a flight, e.g. <timestamp>_images
+    return flight_name.replace("FireFlight_", "") + "_images"
+
+
+def get_image_mosaic_config(mosaic_name):
+    """
+    Returns {file name: content} of the ImageMosaic configuration to place in the images directory.
+    Every granule gets an 'image' attribute holding its file name without the extension.
+    """
+    indexer = "\n".join([
+        f"Name={mosaic_name}",
+        "Wildcard=*.tif",
+        "Schema=*the_geom:Polygon,location:String,image:String",
+        "PropertyCollectors=StringFileNameExtractorSPI[imageregex](image)",
+        "AbsolutePath=false",
+        "Caching=false",
+        "",
+    ])
+    # Avoid backslashes, which are escape characters in .properties files
+    imageregex = "regex=[^/]+(?=[.]tif)\n"
+    return {"indexer.properties": indexer, "imageregex.properties": imageregex}
@@ -0,0 +1,305 @@
+"""
+Tile-partitioned mosaic engine.
+
+Splits the mosaic output extent into tiles, warps each tile in a process pool
+(each worker only sees the PNGs intersecting its tile) and stitches the tiles
+back together into the final GeoTIFF.
+
+When a manifest path is given, the content hash and geotransform of every input
+are recorded next to the mosaic, and a rebuild only re-warps the tiles touched
+by new, changed or removed images; other tiles are reused from the existing mosaic.
+"""
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from osgeo import gdal
+from thermalimageprocessing.archive import iter_file_chunks
+
+logger = logging.getLogger(__name__)
+
+gdal.UseExceptions()
+
+SRC_NODATA = 0
+DST_NODATA = 0
+
+
+def get_output_grid(files):
+    """
+    Returns the (geotransform, xsize, ysize) that a single gdal.Warp call over all the files would produce.
+    """
+    # Warping to an in-memory VRT resolves the output grid from every input without processing any pixels.
+    # GDAL warns that a VRT warp only reads the first source, which does not matter here, so silence it.
+    gdal.PushErrorHandler('CPLQuietErrorHandler')
+    try:
+        grid_ds = gdal.Warp('', files, format="VRT", srcNodata=SRC_NODATA, dstNodata=DST_NODATA)
+    finally:
+        gdal.PopErrorHandler()
+    geotransform = grid_ds.GetGeoTransform()
+    xsize, ysize = grid_ds.RasterXSize, grid_ds.RasterYSize
+    grid_ds = None
+    return geotransform, xsize, ysize
+
+
+def get_file_header(file):
+    """
+    Returns the (geotransform, xsize, ysize) of a raster by reading its header only.
+    """
+    image = gdal.Open(file)
+    header = (image.GetGeoTransform(), image.RasterXSize, image.RasterYSize)
+    image = None
+    return header
+
+
+def get_header_bounds(geotransform, xsize, ysize):
+    """
+    Returns (minx, miny, maxx, maxy) of a raster from its geotransform and size.
+    """
+    return get_window_bounds(geotransform, (0, 0, xsize, ysize))
+
+
+def get_file_bounds(file):
+    """
+    Returns (minx, miny, maxx, maxy) of a raster by reading its header only.
+    """
+    return get_header_bounds(*get_file_header(file))
+
+
+def hash_file(file, chunk_size=8 * 1024 * 1024):
+    """
+    Returns the SHA-256 hex digest of a file's content.
+    """
+    digest = hashlib.sha256()
+    for chunk in iter_file_chunks(file, chunk_size):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_manifest_entries(files, workers, file_headers=None):
+    """
+    Returns {file name: {"hash", "geotransform", "xsize", "ysize"}} for the input files.
+    """
+    if file_headers is None:
+        file_headers = [None] * len(files)
+
+    def entry(file, header):
+        geotransform, xsize, ysize = header if header is not None else get_file_header(file)
+        return {"hash": hash_file(file), "geotransform": list(geotransform), "xsize": xsize, "ysize": ysize}
+
+    # Hashing is I/O bound and hashlib releases the GIL, so threads are enough here
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        entries = list(executor.map(entry, files, file_headers))
+    return {os.path.basename(file): e for file, e in zip(files, entries)}
+
+
+def load_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read mosaic manifest {manifest_path}, rebuilding from scratch: {e}")
+        return None
+
+
+def get_output_signature(output_format, creation_options, output_srs):
+    # What the mosaic file was written with: a change means its tiles cannot be reused
+    return {"format": output_format, "creation_options": list(creation_options), "srs": output_srs}
+
+
+def save_manifest(manifest_path, geotransform, xsize, ysize, tile_size, entries, output_signature, output_path):
+    # The output's size and mtime tie the manifest to the file it describes
+    stat = os.stat(output_path)
+    manifest = {
+        "geotransform": list(geotransform),
+        "xsize": xsize,
+        "ysize": ysize,
+        "tile_size": tile_size,
+        "output": dict(output_signature, size=stat.st_size, mtime_ns=stat.st_mtime_ns),
+        "images": entries,
+    }
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, manifest_path)
+
+
+def remove_manifest(manifest_path):
+    # Called whenever the mosaic is written without updating its manifest, which then no longer describes it
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+
+def manifest_matches(previous, output_path, geotransform, xsize, ysize, tile_size, output_signature):
+    """
+    Whether the previous manifest describes the mosaic file on disk, built on the same grid with the same output settings.
+    """
+    if previous is None or not os.path.exists(output_path):
+        return False
+    stat = os.stat(output_path)
+    return (
+        previous.get("geotransform") == list(geotransform)
+        and (previous.get("xsize"), previous.get("ysize"), previous.get("tile_size")) == (xsize, ysize, tile_size)
+        and previous.get("output") == dict(output_signature, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+    )
+
+
+def get_changed_bounds(previous_images, current_images):
+    """
+    Returns the bounds of every image that was added, removed or changed since the previous manifest.
+    Changed images contribute both their old and their new bounds.
+    """
+    changed = []
+    for name in set(previous_images) | set(current_images):
+        old = previous_images.get(name)
+        new = current_images.get(name)
+        if old == new:
+            continue
+        for e in (old, new):
+            if e is not None:
+                changed.append(get_header_bounds(e["geotransform"], e["xsize"], e["ysize"]))
+    return changed
+
+
+def get_tile_windows(xsize, ysize, tile_size):
+    """
+    Splits an xsize by ysize raster into (xoff, yoff, width, height) pixel windows.
+    """
+    windows = []
+    for yoff in range(0, ysize, tile_size):
+        for xoff in range(0, xsize, tile_size):
+            windows.append((xoff, yoff, min(tile_size, xsize - xoff), min(tile_size, ysize - yoff)))
+    return windows
+
+
+def get_window_bounds(geotransform, window):
+    """
+    Returns the (minx, miny, maxx, maxy) georeferenced bounds of a pixel window.
+    """
+    xoff, yoff, width, height = window
+    ulx = geotransform[0] + xoff * geotransform[1]
+    uly = geotransform[3] + yoff * geotransform[5]
+    lrx = geotransform[0] + (xoff + width) * geotransform[1]
+    lry = geotransform[3] + (yoff + height) * geotransform[5]
+    return (min(ulx, lrx), min(uly, lry), max(ulx, lrx), max(uly, lry))
+
+
+def bounds_intersect(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def render_tile(tile_path, files, bounds, width, height, source_mosaic=None, window=None):
+    """
+    Produces a single tile of the mosaic grid, either by warping the given files onto it
+    or, for unchanged tiles, by copying its window out of the existing mosaic.
+    Runs inside a worker process, so only picklable arguments are passed in.
+    """
+    if source_mosaic is not None:
+        gdal.Translate(tile_path, source_mosaic, format="GTiff", srcWin=list(window))
+        return tile_path
+    gdal.Warp(
+        tile_path,
+        files,
+        format="GTiff",
+        outputBounds=bounds,
+        width=width,
+        height=height,
+        srcNodata=SRC_NODATA,
+        dstNodata=DST_NODATA,
+    )
+    return tile_path
+
+
+def stitch_tiles(tile_paths, output_path, geotransform, xsize, ysize, output_format, creation_options, output_srs=None):
+    """
+    Stitches the warped tiles into the final raster covering the whole mosaic grid.
+    """
+    vrt_path = os.path.join(os.path.dirname(tile_paths[0]), "tiles.vrt")
+    # Force the full grid, so tiles without any input image are filled with nodata like gdal.Warp does
+    output_bounds = get_window_bounds(geotransform, (0, 0, xsize, ysize))
+    # Tiles reused from an existing mosaic carry its SRS while freshly warped ones do not
+    vrt = gdal.BuildVRT(vrt_path, tile_paths, outputBounds=output_bounds, xRes=abs(geotransform[1]), yRes=abs(geotransform[5]), allowProjectionDifference=True)
+    vrt = None
+    gdal.Translate(output_path, vrt_path, format=output_format, creationOptions=creation_options, outputSRS=output_srs)
+
+
+def tiled_merge(files, output_path, workers, tile_size, output_format="GTiff", creation_options=None, output_srs=None, manifest_path=None, file_headers=None):
+    """
+    Merges the files into output_path by warping tiles of the output grid in parallel.
+    The output grid, nodata handling and pixel values are the same as a single gdal.Warp call over all the files.
+    If manifest_path is given and matches the existing mosaic, only tiles touched by changed images are re-warped.
+    file_headers may hold the (geotransform, xsize, ysize) of each file when already known, to avoid reopening them.
+    """
+    if creation_options is None:
+        creation_options = ["COMPRESS=DEFLATE"]
+    geotransform, xsize, ysize = get_output_grid(files)
+    windows = get_tile_windows(xsize, ysize, tile_size)
+    logger.info(f"Mosaic grid is {xsize}x{ysize} pixels, split into {len(windows)} tile(s) of up to {tile_size}px.")
+
+    manifest_entries = None
+    changed_bounds = None
+    if manifest_path is not None:
+        manifest_entries = build_manifest_entries(files, workers, file_headers)
+        file_bounds = [get_header_bounds(e["geotransform"], e["xsize"], e["ysize"]) for e in manifest_entries.values()]
+        output_signature = get_output_signature(output_format, creation_options, output_srs)
+        previous = load_manifest(manifest_path)
+        if manifest_matches(previous, output_path, geotransform, xsize, ysize, tile_size, output_signature):
+            changed_bounds = get_changed_bounds(previous.get("images", {}), manifest_entries)
+            if not changed_bounds:
+                logger.info(f"No input images changed since the last build, keeping existing mosaic: {os.path.basename(output_path)}")
+                return
+            logger.info(f"Incremental rebuild: {len(changed_bounds)} changed image footprint(s) since the last build.")
+        else:
+            logger.info("No matching mosaic manifest found, building the full mosaic.")
+            remove_manifest(manifest_path)
+    elif file_headers is not None:
+        file_bounds = [get_header_bounds(*header) for header in file_headers]
+    else:
+        file_bounds = [get_file_bounds(file) for file in files]
+
+    tiles_folder = tempfile.mkdtemp(prefix=".mosaic_tiles_", dir=os.path.dirname(output_path))
+    try:
+        # Build the tasks, keeping the original file order so overlapping images are drawn in the same order
+        tasks = []
+        reused = 0
+        for index, window in enumerate(windows):
+            bounds = get_window_bounds(geotransform, window)
+            tile_path = os.path.join(tiles_folder, f"tile_{index:06d}.tif")
+            if changed_bounds is not None and not any(bounds_intersect(bounds, cb) for cb in changed_bounds):
+                # Untouched tile: copy it out of the existing mosaic instead of warping it again
+                tasks.append((tile_path, [], bounds, window[2], window[3], output_path, window))
+                reused += 1
+                continue
+            tile_files = [file for file, fb in zip(files, file_bounds) if bounds_intersect(bounds, fb)]
+            if not tile_files:
+                continue
+            tasks.append((tile_path, tile_files, bounds, window[2], window[3], None, None))
+
+        if not tasks:
+            raise ValueError("None of the input files intersect the mosaic extent.")
+
+        workers = max(1, min(workers, len(tasks)))
+        logger.info(f"Rendering {len(tasks)} tile(s) ({reused} reused from the existing mosaic) with {workers} worker process(es)...")
+        if workers == 1:
+            tile_paths = [render_tile(*task) for task in tasks]
+        else:
+            # Spawn rather than fork: the pipeline calls this from a thread, and forking a multi-threaded process is unsafe
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+                tile_paths = list(executor.map(render_tile, *zip(*tasks)))
+
+        # Write next to the output and swap it in, since unchanged tiles may still be read from the existing mosaic
+        root, ext = os.path.splitext(output_path)
+        partial_path = root + ".partial" + ext
+        logger.info(f"Stitching {len(tile_paths)} tile(s) into: {os.path.basename(output_path)}")
+        stitch_tiles(tile_paths, partial_path, geotransform, xsize, ysize, output_format, creation_options, output_srs)
+        os.replace(partial_path, output_path)
+    finally:
+        shutil.rmtree(tiles_folder, ignore_errors=True)
+
+    if manifest_path is not None:
+        save_manifest(manifest_path, geotransform, xsize, ysize, tile_size, manifest_entries, output_signature, output_path)
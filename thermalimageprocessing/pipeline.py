@@ -0,0 +1,88 @@
+"""
+Dependency-graph executor for the thermal processing pipeline.
+
+Each stage declares the stages it requires. Stages whose requirements have
+completed run concurrently in a thread pool, so the wall-clock time of a flight
+approaches its longest dependency path instead of the sum of all steps.
+Messages reported by each stage are kept per stage and joined in declaration
+order, so the notification email reads the same whatever order the stages ran in.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+
+class Stage:
+    def __init__(self, name, func, requires=()):
+        self.name = name
+        self.func = func
+        self.requires = tuple(requires)
+
+
+class Pipeline:
+    def __init__(self, max_workers=1):
+        self.max_workers = max_workers
+        self.stages = []
+        self.results = {}
+        self.messages = {}
+
+    def stage(self, name, requires=()):
+        """
+        Decorator registering a stage. The function receives the results of the completed stages,
+        and its return value becomes this stage's result.
+        """
+        def decorator(func):
+            if name in self.messages:
+                raise ValueError(f"Duplicate pipeline stage: {name}")
+            # Requiring only already declared stages keeps the graph acyclic, and the declaration order a valid sequential order
+            unknown = [r for r in requires if r not in self.messages]
+            if unknown:
+                raise ValueError(f"Pipeline stage '{name}' requires undeclared stage(s): {unknown}")
+            self.stages.append(Stage(name, func, requires))
+            self.messages[name] = []
+            return func
+        return decorator
+
+    def report(self, name, message):
+        self.messages[name].append(message)
+
+    def get_message(self):
+        return "".join("\n" + message for stage in self.stages for message in self.messages[stage.name])
+
+    def run(self):
+        """
+        Runs every stage once its requirements have completed.
+        The first failing stage stops any further stage from starting; stages already running
+        are allowed to finish, then the exception is raised.
+        """
+        if self.max_workers <= 1:
+            for stage in self.stages:
+                self.results[stage.name] = stage.func(self.results)
+            return self.results
+
+        pending = list(self.stages)
+        running = {}
+        first_error = None
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                if first_error is None:
+                    for stage in list(pending):
+                        if all(r in self.results for r in stage.requires):
+                            pending.remove(stage)
+                            running[executor.submit(stage.func, self.results)] = stage
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    try:
+                        self.results[stage.name] = future.result()
+                    except Exception as e:
+                        logger.error(f"Pipeline stage '{stage.name}' failed: {e}")
+                        if first_error is None:
+                            first_error = e
+
+        if first_error is not None:
+            raise first_error
+        return self.results
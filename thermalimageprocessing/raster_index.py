@@ -0,0 +1,131 @@
+"""
+Flight-level raster metadata index.
+
+Reads the header of every input image once (in parallel, no pixel data) and keeps
+the geotransform, size, nodata value and mtime of each, so the pipeline stages do
+not have to reopen the same PNGs with gdal.Open again and again. The index is
+persisted as a JSON sidecar, and entries whose file size and mtime are unchanged
+are reused on reruns without touching the image.
+"""
+import os
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from osgeo import gdal
+from thermalimageprocessing.archive import stat_file
+
+logger = logging.getLogger(__name__)
+
+gdal.UseExceptions()
+
+
+class RasterHeader:
+    def __init__(self, path, geotransform, xsize, ysize, nodata, mtime, size):
+        self.path = path
+        self.geotransform = tuple(geotransform)
+        self.xsize = xsize
+        self.ysize = ysize
+        self.nodata = nodata
+        self.mtime = mtime
+        self.size = size
+
+    @property
+    def corners(self):
+        # Same as get_corners() on an open dataset: (ulx, uly, lrx, lry)
+        ulx, xres, xskew, uly, yskew, yres = self.geotransform
+        lrx = ulx + (self.xsize * xres)
+        lry = uly + (self.ysize * yres)
+        return (ulx, uly, lrx, lry)
+
+    @property
+    def bounds(self):
+        ulx, uly, lrx, lry = self.corners
+        return (min(ulx, lrx), min(uly, lry), max(ulx, lrx), max(uly, lry))
+
+    def to_dict(self):
+        return {
+            "geotransform": list(self.geotransform),
+            "xsize": self.xsize,
+            "ysize": self.ysize,
+            "nodata": self.nodata,
+            "mtime": self.mtime,
+            "size": self.size,
+        }
+
+    @classmethod
+    def from_dict(cls, path, data):
+        return cls(path, data["geotransform"], data["xsize"], data["ysize"], data["nodata"], data["mtime"], data["size"])
+
+
+def read_header(path):
+    """
+    Opens a raster and reads its header only.
+    """
+    mtime, size = stat_file(path)
+    image = gdal.Open(path)
+    nodata = image.GetRasterBand(1).GetNoDataValue() if image.RasterCount > 0 else None
+    header = RasterHeader(path, image.GetGeoTransform(), image.RasterXSize, image.RasterYSize, nodata, mtime, size)
+    image = None
+    return header
+
+
+class RasterIndex:
+    def __init__(self, headers=None):
+        # Keyed by the full path of each image
+        self.headers = headers or {}
+
+    def __getitem__(self, path):
+        return self.headers[path]
+
+    def __contains__(self, path):
+        return path in self.headers
+
+    def __len__(self):
+        return len(self.headers)
+
+    @classmethod
+    def build(cls, files, sidecar_path=None, workers=8):
+        """
+        Builds the index for the files, reusing unchanged entries from the sidecar if there is one.
+        """
+        cached = load_sidecar(sidecar_path) if sidecar_path else {}
+        headers = {}
+        to_read = []
+        for path in files:
+            entry = cached.get(os.path.basename(path))
+            if entry is not None:
+                mtime, size = stat_file(path)
+                if entry["mtime"] == mtime and entry["size"] == size:
+                    headers[path] = RasterHeader.from_dict(path, entry)
+                    continue
+            to_read.append(path)
+
+        if to_read:
+            # gdal.Open releases the GIL, so a thread pool is enough to overlap the header reads
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+                for header in executor.map(read_header, to_read):
+                    headers[header.path] = header
+        logger.info(f"Raster index: {len(headers) - len(to_read)} header(s) reused, {len(to_read)} read from disk.")
+
+        index = cls(headers)
+        if sidecar_path:
+            index.save(sidecar_path)
+        return index
+
+    def save(self, sidecar_path):
+        data = {os.path.basename(path): header.to_dict() for path, header in self.headers.items()}
+        tmp_path = sidecar_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, sidecar_path)
+
+
+def load_sidecar(sidecar_path):
+    if not os.path.exists(sidecar_path):
+        return {}
+    try:
+        with open(sidecar_path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read raster index {sidecar_path}, rescanning: {e}")
+        return {}
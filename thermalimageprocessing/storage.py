@@ -0,0 +1,243 @@
+"""
+GeoServer storage helpers.
+
+GeoServer reads the mosaics and hotspot images from an rclone mount. Files are
+copied there with a kernel-side copy when the filesystems allow it (large
+buffered chunks otherwise), under a temporary name that is renamed into place
+once the size (and optionally the checksum) has been verified, so GeoServer
+never sees a half-written file. Content produced in memory is written the same
+way, in a single sequential write.
+
+Instead of sleeping for a fixed time before publishing, the pipeline polls the
+destination files with backoff until they are visible with the expected size
+(and checksum, if enabled), and carries on as soon as they are.
+"""
+import os
+import time
+import uuid
+import errno
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def file_checksum(path, chunk_size=8 * 1024 * 1024):
+    """
+    Returns the SHA-256 hex digest of a file's content.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Errors meaning a kernel-side copy is not supported between these files, rather than a real I/O error
+_UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL, errno.ENOTSUP, errno.EBADF}
+
+COPY_CHUNK_SIZE = 16 * 1024 * 1024
+
+
+class CopyResult:
+    def __init__(self, source_path, dest_path, size=0, method=None, checksum=None, seconds=0.0, error=None):
+        self.source_path = source_path
+        self.dest_path = dest_path
+        self.size = size
+        self.method = method
+        self.checksum = checksum
+        self.seconds = seconds
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        return f"CopyResult({self.dest_path!r}, ok={self.ok}, method={self.method!r}, size={self.size})"
+
+
+def _copy_file_range(src, dst, size):
+    offset = 0
+    while offset < size:
+        copied = os.copy_file_range(src.fileno(), dst.fileno(), size - offset)
+        if copied == 0:
+            break
+        offset += copied
+    return offset
+
+
+def _sendfile(src, dst, size):
+    offset = 0
+    while offset < size:
+        sent = os.sendfile(dst.fileno(), src.fileno(), offset, min(size - offset, COPY_CHUNK_SIZE))
+        if sent == 0:
+            break
+        offset += sent
+    return offset
+
+
+def _copy_chunks(src, dst, digest=None):
+    copied = 0
+    buffer = bytearray(COPY_CHUNK_SIZE)
+    view = memoryview(buffer)
+    while True:
+        n = src.readinto(buffer)
+        if not n:
+            break
+        dst.write(view[:n])
+        if digest is not None:
+            digest.update(view[:n])
+        copied += n
+    return copied
+
+
+def _copy_data(src, dst, size, digest=None):
+    """
+    Copies src to dst (both open at offset 0), trying copy_file_range, then sendfile, then buffered chunks.
+    A kernel method is only abandoned if it fails before copying anything. Returns the method used.
+    """
+    if digest is None:
+        for method, copy in (("copy_file_range", _copy_file_range), ("sendfile", _sendfile)):
+            if not hasattr(os, method):
+                continue
+            try:
+                copied = copy(src, dst, size)
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED_ERRNOS or dst.tell() != 0 or os.fstat(dst.fileno()).st_size != 0:
+                    raise
+                continue
+            if copied != size:
+                raise IOError(f"Short copy: {copied} of {size} bytes")
+            return method
+    # The checksum is computed on the fly here, so the source is only read once
+    src.seek(0)
+    dst.seek(0)
+    _copy_chunks(src, dst, digest)
+    return "chunks"
+
+
+def _get_partial_path(dest_path):
+    # Hidden temporary file next to the destination, so the final rename stays on the same filesystem
+    return os.path.join(os.path.dirname(dest_path), f".{os.path.basename(dest_path)}.{uuid.uuid4().hex}.partial")
+
+
+def copy_file(source_path, dest_path, verify_checksum=False):
+    """
+    Copies source_path to dest_path through a temporary file in the destination directory,
+    renamed into place only once its size (and checksum, if verify_checksum) matches the source.
+    Never raises: returns a CopyResult whose error is set if the copy failed.
+    """
+    start = time.monotonic()
+    tmp_path = _get_partial_path(dest_path)
+    result = CopyResult(source_path, dest_path)
+    try:
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        size = os.path.getsize(source_path)
+        digest = hashlib.sha256() if verify_checksum else None
+        with open(source_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+            result.method = _copy_data(src, dst, size, digest)
+
+        copied_size = os.path.getsize(tmp_path)
+        if copied_size != size:
+            raise IOError(f"Size mismatch after copy: {copied_size} bytes written, {size} expected")
+        if verify_checksum:
+            result.checksum = digest.hexdigest() if result.method == "chunks" else file_checksum(source_path)
+            copied_checksum = file_checksum(tmp_path)
+            if copied_checksum != result.checksum:
+                raise IOError(f"Checksum mismatch after copy: {copied_checksum} != {result.checksum}")
+
+        os.replace(tmp_path, dest_path)
+        result.size = size
+    except Exception as e:
+        result.error = str(e)
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+    result.seconds = time.monotonic() - start
+    return result
+
+
+def write_file(data, dest_path, verify_checksum=False):
+    """
+    Writes in-memory content to dest_path through a temporary file renamed into place,
+    like copy_file. The checksum of the content is always recorded, as it costs no extra read.
+    Never raises: returns a CopyResult (with no source path) whose error is set if the write failed.
+    """
+    start = time.monotonic()
+    tmp_path = _get_partial_path(dest_path)
+    result = CopyResult(None, dest_path, method="write", checksum=hashlib.sha256(data).hexdigest())
+    try:
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+
+        written_size = os.path.getsize(tmp_path)
+        if written_size != len(data):
+            raise IOError(f"Size mismatch after write: {written_size} bytes written, {len(data)} expected")
+        if verify_checksum:
+            written_checksum = file_checksum(tmp_path)
+            if written_checksum != result.checksum:
+                raise IOError(f"Checksum mismatch after write: {written_checksum} != {result.checksum}")
+
+        os.replace(tmp_path, dest_path)
+        result.size = len(data)
+    except Exception as e:
+        result.error = str(e)
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+    result.seconds = time.monotonic() - start
+    return result
+
+
+def is_file_visible(dest_path, expected_size, expected_checksum=None):
+    """
+    Checks whether dest_path exists on the destination storage with the expected size (and checksum).
+    """
+    try:
+        if os.path.getsize(dest_path) != expected_size:
+            return False
+    except OSError:
+        return False
+    if expected_checksum is not None:
+        return file_checksum(dest_path) == expected_checksum
+    return True
+
+
+def wait_until_visible(copy_results, timeout, verify_checksum=False, initial_delay=0.5, max_delay=10):
+    """
+    Polls the destination of each successful CopyResult until it is visible with the copied
+    size (and checksum), backing off between polls, for at most `timeout` seconds.
+    Returns the list of destination paths that did not become visible in time.
+    """
+    pending = {}
+    for result in copy_results:
+        expected_checksum = None
+        if verify_checksum:
+            expected_checksum = result.checksum or file_checksum(result.source_path)
+        pending[result.dest_path] = (result.size, expected_checksum)
+
+    if not pending:
+        return []
+
+    logger.info(f"Waiting for {len(pending)} file(s) to be visible on GeoServer storage (timeout {timeout}s)...")
+    start = time.monotonic()
+    delay = initial_delay
+    while True:
+        for dest_path, (expected_size, expected_checksum) in list(pending.items()):
+            if is_file_visible(dest_path, expected_size, expected_checksum):
+                del pending[dest_path]
+
+        elapsed = time.monotonic() - start
+        if not pending:
+            logger.info(f"All files visible on GeoServer storage after {elapsed:.1f}s.")
+            return []
+        if elapsed >= timeout:
+            logger.warning(f"{len(pending)} file(s) still not visible on GeoServer storage after {timeout}s: {sorted(pending)}")
+            return sorted(pending)
+
+        time.sleep(min(delay, timeout - elapsed))
+        delay = min(delay * 2, max_delay)
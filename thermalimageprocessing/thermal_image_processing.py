@@ -2,19 +2,30 @@ import os
 import shutil
 import subprocess
 import sys
-import requests
 import time
+import uuid
 import decouple
 import logging
 import django
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 #import gdal
 from osgeo import gdal
 from thermalimageprocessing import gdal_edit
+from thermalimageprocessing import mosaic
+from thermalimageprocessing.raster_index import RasterIndex
+from thermalimageprocessing.districts import get_district_lookup
+from thermalimageprocessing.pipeline import Pipeline
+from thermalimageprocessing.archive import get_archive_root, path_exists, list_dir, stat_file, extract_required_members
+from thermalimageprocessing.storage import wait_until_visible, copy_file, write_file
+from thermalimageprocessing.geoserver import GeoServerPublisher, GeoServerError, get_mosaic_item, get_hotspot_image_item, get_image_mosaic_name, get_image_mosaic_config
 import fiona
 from osgeo import ogr
 import geopandas as gpd
 import pandas as pd
-from shapely.wkt import loads
+import numpy as np
+import shapely
 from shapely.geometry import LineString, Polygon
 from sqlalchemy import create_engine
 from postmarker.core import PostmarkClient
@@ -58,6 +69,9 @@ container_name = os.environ.get('general_container_name') # config.get('general'
 districts_dataset_name = os.environ.get('general_districts_dataset_name') # config.get('general', 'districts_dataset_name')
 districts_gpkg = os.path.join(os.path.dirname(__file__), districts_dataset_name)
 districts_layer_name = os.environ.get('general_districts_layer_name') #config.get('general', 'districts_layer_name')
+# Pipeline stages run concurrently, and they all write their layers to the same output geopackage
+geopackage_lock = threading.Lock()
+
 user = os.environ.get('geoserver_user') #config.get('geoserver', 'user')
 gs_pwd = os.environ.get('geoserver_password') #config.get('geoserver', 'gs_pwd')
 
@@ -67,15 +81,19 @@ class Footprint:
         self.as_poly = None
         self.districts = []
 
-def check_first_two_images_overlap(files):
+def check_first_two_images_overlap(files, index=None):
     overlap = False
     if len(files) >= 2:
-        first_image = gdal.Open(files[0])
-        second_image = gdal.Open(files[1])
-        ulx1, uly1, lrx1, lry1 = get_corners(first_image)
-        ulx2, uly2, lrx2, lry2 = get_corners(second_image)
-        first_image = None
-        second_image = None
+        if index is not None:
+            ulx1, uly1, lrx1, lry1 = index[files[0]].corners
+            ulx2, uly2, lrx2, lry2 = index[files[1]].corners
+        else:
+            first_image = gdal.Open(files[0])
+            second_image = gdal.Open(files[1])
+            ulx1, uly1, lrx1, lry1 = get_corners(first_image)
+            ulx2, uly2, lrx2, lry2 = get_corners(second_image)
+            first_image = None
+            second_image = None
         # If second_image is to the right of first_image
         if ulx2 >= ulx1:
             # Is it too far right?
@@ -101,11 +119,15 @@ def check_first_two_images_overlap(files):
                         overlap = True
     return overlap
 
-def check_timediff_first_two_images(files):
+def check_timediff_first_two_images(files, index=None):
     first_file = files[0]
     second_file = files[1]
-    first_time = os.path.getmtime(first_file)
-    second_time = os.path.getmtime(second_file)
+    if index is not None:
+        first_time = index[first_file].mtime
+        second_time = index[second_file].mtime
+    else:
+        first_time = stat_file(first_file)[0]
+        second_time = stat_file(second_file)[0]
     timediff = second_time - first_time
     return timediff
 
@@ -115,17 +137,37 @@ def get_corners(image):
     lry = uly + (image.RasterYSize * yres)
     return (ulx, uly, lrx, lry)
 
-def get_exclude_first(files):
+def get_exclude_first(files, index=None):
     # Check if first photo should be excluded - need time diff btw first two > 180s AND no overlap in first two images
-    overlap = check_first_two_images_overlap(files)
-    timediff = check_timediff_first_two_images(files)
+    overlap = check_first_two_images_overlap(files, index)
+    timediff = check_timediff_first_two_images(files, index)
     if (not overlap) and timediff > 180:
         exclude_first = True
     else:
         exclude_first = False
     return exclude_first
 
-def merge(files, output_path):
+def get_mosaic_output_options():
+    # Returns the GDAL driver and creation options for the configured mosaic output profile.
+    if settings.MOSAIC_OUTPUT_PROFILE == "cog":
+        # Tiled, compressed, with internal overviews so GeoServer can serve zoomed-out requests from them
+        creation_options = [
+            "COMPRESS=DEFLATE",
+            f"BLOCKSIZE={settings.MOSAIC_COG_BLOCKSIZE}",
+            "OVERVIEWS=AUTO",
+            "BIGTIFF=IF_SAFER",
+            "NUM_THREADS=ALL_CPUS",
+        ]
+        if settings.MOSAIC_COG_OVERVIEW_RESAMPLING:
+            creation_options.append(f"RESAMPLING={settings.MOSAIC_COG_OVERVIEW_RESAMPLING}")
+        return "COG", creation_options
+    return "GTiff", ["COMPRESS=DEFLATE"] # Compresses the output to save disk space
+
+def get_mosaic_manifest_path(output_path):
+    # Manifest of the inputs of an incremental mosaic (see mosaic.tiled_merge)
+    return os.path.join(os.path.dirname(output_path), "mosaic_manifest.json")
+
+def merge(files, output_path, index=None):
     # Merges PNGs and saves the output to the specified mosaic_image path.
     # Using gdal.Warp instead of gdal_merge.main ensures better compatibility 
     # between different GDAL versions (e.g., 3.0 vs 3.8) and offers better performance.
@@ -134,78 +176,222 @@ def merge(files, output_path):
     msg = f"Merging {file_count} input files into: {output_name}..."
     logger.info(msg)
 
+    output_format, creation_options = get_mosaic_output_options()
+    # The COG profile assigns the projection (EPSG:28350) while writing, instead of reopening the output afterwards
+    output_srs = "EPSG:28350" if output_format == "COG" else None
+    manifest_path = get_mosaic_manifest_path(output_path)
+
     try:
-        gdal.Warp(
-            output_path,       # Output file path
-            files,              # List of input files
-            format="GTiff",
-            srcNodata=0,        # Equivalent to -n 0
-            dstNodata=0,         # Equivalent to -a_nodata 0
-            options=["-co", "COMPRESS=DEFLATE"] # Compresses the output to save disk space
-        )
+        if settings.MOSAIC_MODE == "tiled" or settings.MOSAIC_INCREMENTAL:
+            # Split the output into tiles and warp them in a process pool.
+            # In incremental mode a manifest of the inputs is kept next to the mosaic, so a rebuild
+            # only re-warps the tiles touched by new or changed images.
+            # The projection is assigned while stitching, so the mosaic is not modified after its manifest is written.
+            output_srs = "EPSG:28350"
+            if not settings.MOSAIC_INCREMENTAL:
+                mosaic.remove_manifest(manifest_path)
+            file_headers = [(index[file].geotransform, index[file].xsize, index[file].ysize) for file in files] if index is not None else None
+            mosaic.tiled_merge(files, output_path, settings.MOSAIC_WORKERS, settings.MOSAIC_TILE_SIZE, output_format, creation_options, output_srs,
+                               manifest_path if settings.MOSAIC_INCREMENTAL else None, file_headers)
+        else:
+            mosaic.remove_manifest(manifest_path)
+            gdal.Warp(
+                output_path,       # Output file path
+                files,              # List of input files
+                format=output_format,
+                srcSRS=output_srs,  # The PNGs carry no SRS, so this becomes the output SRS
+                srcNodata=0,        # Equivalent to -n 0
+                dstNodata=0,         # Equivalent to -a_nodata 0
+                creationOptions=creation_options
+            )
     except Exception as e:
         # Log the error with stack trace for debugging
         logger.error(f"Merge failed: {e}", exc_info=True)
         # Also print to stdout so it appears in the subprocess runner's log
         raise
 
-    # Assign the projection (EPSG:28350) to the output image
-    gdal_edit_args = ["", "-a_srs", "EPSG:28350", output_path]
-    # gdal_edit_args = ["", "-a_srs", "EPSG:4326", mosaic_image]
-    gdal_edit.main(gdal_edit_args)
+    if output_srs is None:
+        # Assign the projection (EPSG:28350) to the output image
+        gdal_edit_args = ["", "-a_srs", "EPSG:28350", output_path]
+        # gdal_edit_args = ["", "-a_srs", "EPSG:4326", mosaic_image]
+        gdal_edit.main(gdal_edit_args)
+
+def build_virtual_mosaic(files, vrt_path):
+    # Builds a VRT mosaic over the PNGs. Only headers are read, so this takes seconds
+    # and the flight can be inspected straight away without writing the full mosaic.
+    logger.info(f"Building virtual mosaic of {len(files)} input files: {os.path.basename(vrt_path)}...")
+    vrt = gdal.BuildVRT(
+        vrt_path,
+        files,
+        srcNodata=0,
+        VRTNodata=0,
+        resolution="highest",
+        outputSRS="EPSG:28350"
+    )
+    vrt = None
+
+def materialise_mosaic(vrt_path, output_path):
+    # Writes the virtual mosaic out as the real mosaic image, using the configured output profile.
+    # The VRT already carries the projection (EPSG:28350), so no gdal_edit pass is required.
+    logger.info(f"Materialising virtual mosaic into: {os.path.basename(output_path)}...")
+    output_format, creation_options = get_mosaic_output_options()
+    mosaic.remove_manifest(get_mosaic_manifest_path(output_path))
+    gdal.Translate(output_path, vrt_path, format=output_format, creationOptions=creation_options)
+    logger.info(f"Virtual mosaic materialised: {os.path.basename(output_path)}")
+
+# Limits the number of warps running at once when several flights are processed in parallel
+# (set in each ImportsProcessor worker process; None means no limit)
+warp_slots = None
+
+def set_warp_slots(semaphore):
+    global warp_slots
+    warp_slots = semaphore
+
+@contextlib.contextmanager
+def warp_slot():
+    if warp_slots is None:
+        yield
+        return
+    logger.info("Waiting for a warp slot...")
+    with warp_slots:
+        yield
+
+def materialise_and_publish_mosaic(flight_path):
+    """
+    Materialises a flight's virtual mosaic, then copies it to GeoServer storage and publishes it.
+    Used for flights processed with MOSAIC_MODE=vrt and MOSAIC_VRT_MATERIALISE=on_demand.
+    """
+    flight_name = os.path.basename(flight_path.rstrip(os.sep))
+    output_folder = os.path.join(flight_path, "Processed")
+    mosaic_vrt = os.path.join(output_folder, flight_name + "_mosaic.vrt")
+    mosaic_image = os.path.join(output_folder, flight_name + "_mosaic" + output_image_file_ext)
+
+    if not os.path.exists(mosaic_vrt):
+        raise FileNotFoundError(f"Virtual mosaic not found: {mosaic_vrt}")
 
-def translate_png2tif(input_png, short_file, flight_name):
-    # Translates png to tif
-    output_tif = input_png.replace(".png", ".tif")
+    materialise_mosaic(mosaic_vrt, mosaic_image)
+    copy_result = copy_to_geoserver_storage(mosaic_image, flight_name + ".tif")
+    if not copy_result.ok:
+        raise RuntimeError(f"Failed to copy {mosaic_image} to GeoServer storage: {copy_result.error}")
+    if wait_until_visible([copy_result], settings.STORAGE_SYNC_TIMEOUT, settings.STORAGE_SYNC_VERIFY_CHECKSUM):
+        raise TimeoutError(f"{copy_result.dest_path} was not visible on GeoServer storage after {settings.STORAGE_SYNC_TIMEOUT}s.")
+    publish_image_on_geoserver(flight_name)
+
+def translate_png2tif(input_png, short_file, flight_name, tif_folder=None):
+    # Translates png to tif, and copies it to GeoServer storage
+    # The local tif goes to tif_folder, next to the png by default
     tif_filename = short_file.replace(".png", ".tif")
-    gdal.Translate(output_tif, input_png, outputSRS="EPSG:28350")
     relative_path = flight_name + "_images/" + tif_filename
-    copy_to_geoserver_storage(output_tif, relative_path)
+    output_tif = os.path.join(tif_folder or os.path.dirname(input_png), tif_filename)
+    if settings.HOTSPOT_TIF_OUTPUT_MODE == "direct":
+        return translate_png2tif_direct(input_png, relative_path, output_tif)
+    gdal.Translate(output_tif, input_png, outputSRS="EPSG:28350")
+    copy_result = copy_to_geoserver_storage(output_tif, relative_path)
     #publish_image_on_geoserver(flight_name, tif_filename)
+    return copy_result
+
+def translate_png2tif_direct(input_png, relative_dest_path, local_tif):
+    """
+    Translates png to tif in memory (/vsimem/) and writes it once to GeoServer storage,
+    instead of writing it locally and reading it back for the copy.
+    A local copy is also written to local_tif if HOTSPOT_TIF_KEEP_LOCAL is set.
+    """
+    mem_tif = f"/vsimem/{uuid.uuid4().hex}.tif"
+    try:
+        gdal.Translate(mem_tif, input_png, outputSRS="EPSG:28350")
+        data = read_vsimem_file(mem_tif)
+    finally:
+        gdal.Unlink(mem_tif)
+
+    if settings.HOTSPOT_TIF_KEEP_LOCAL:
+        with open(local_tif, 'wb') as f:
+            f.write(data)
+
+    dest_path = os.path.join(settings.GEOSERVER_STORAGE_PATH, relative_dest_path)
+    result = write_file(data, dest_path, verify_checksum=settings.STORAGE_COPY_VERIFY_CHECKSUM)
+    if not result.ok:
+        logger.error(f"Failed to write {dest_path} to rclone mount: {result.error}")
+    return result
+
+def read_vsimem_file(path):
+    # Returns the content of a GDAL in-memory file
+    f = gdal.VSIFOpenL(path, 'rb')
+    try:
+        gdal.VSIFSeekL(f, 0, 2)
+        size = gdal.VSIFTellL(f)
+        gdal.VSIFSeekL(f, 0, 0)
+        return gdal.VSIFReadL(1, size, f)
+    finally:
+        gdal.VSIFCloseL(f)
+
+def convert_hotspot_images(images, raw_img_folder, flight_name, workers, tif_folder=None):
+    """
+    Translates the hotspot PNGs to TIF and copies them to GeoServer storage in a bounded thread pool,
+    so translations and copies of different images overlap. A failed image does not stop the others.
+    Local TIFs are written to tif_folder (raw_img_folder by default).
+    Returns (converted, failed): converted is a list of (image, CopyResult),
+    failed maps each image that could not be converted or copied to its error.
+    """
+    converted = []
+    failed = {}
+    if tif_folder is not None:
+        os.makedirs(tif_folder, exist_ok=True)
+    # gdal.Translate and the file copy both release the GIL, so threads run them in parallel
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {
+            executor.submit(translate_png2tif, os.path.join(raw_img_folder, img), img, flight_name, tif_folder): img
+            for img in images
+        }
+        for future in as_completed(futures):
+            img = futures[future]
+            try:
+                copy_result = future.result()
+            except Exception as e:
+                logger.error(f"Failed to convert hotspot image {img}: {e}", exc_info=True)
+                failed[img] = str(e)
+                continue
+            if not copy_result.ok:
+                failed[img] = f"Copy to GeoServer storage failed: {copy_result.error}"
+                continue
+            converted.append((img, copy_result))
+    # Keep the hotspot images order for publishing and reporting
+    converted.sort(key=lambda item: item[0])
+    return converted, failed
 
 def copy_to_geoserver_storage(source_file, relative_dest_path):
     """
     Copies the processed image file to the shared storage mount for GeoServer.
+    The file only appears under its final name once fully written (and verified, if configured).
+    Returns a CopyResult; check its ok attribute.
     """
-    try:
-        # Define the target base path
-        mount_base_path = "/rclone-mounts/thermalimaging-flightmosaics"
-        
-        # Construct the full destination path
-        # blob_name is used here as the relative path (e.g., 'FlightName.tif' or 'FlightName_images/xxx.tif')
-        dest_path = os.path.join(mount_base_path, relative_dest_path)
+    # Define the target base path
+    mount_base_path = settings.GEOSERVER_STORAGE_PATH
 
-        try:
-            file_size = os.path.getsize(source_file)
-            file_size_mb = file_size / (1024 * 1024) # Convert to MB
-            logger.info(f"Copying file ({file_size_mb:.2f} MB) to GeoServer storage...")
-        except OSError:
-            # Handle cases where file might not exist yet (though unlikely here)
-            logger.warning(f"Copying file to GeoServer storage (Size unknown).")
-
-        logger.info(f"Source: {source_file}")
-        logger.info(f"Destination: {dest_path}")
-
-        # Extract the directory path
-        dest_dir = os.path.dirname(dest_path)
-        
-        # Create the directory if it does not exist
-        if not os.path.exists(dest_dir):
-            os.makedirs(dest_dir, exist_ok=True)
-        
-        # Copy the image file to the destination
-        shutil.copyfile(source_file, dest_path)
+    # Construct the full destination path
+    # relative_dest_path is e.g. 'FlightName.tif' or 'FlightName_images/xxx.tif'
+    dest_path = os.path.join(mount_base_path, relative_dest_path)
 
-        logger.info(f"Copy complete.") 
-        
-    except Exception as e:
-        error_msg = f"Failed to copy file to rclone mount: {e}"
-        # Log the error with full stack trace
-        logger.error(error_msg, exc_info=True)
+    try:
+        file_size_mb = os.path.getsize(source_file) / (1024 * 1024) # Convert to MB
+        logger.info(f"Copying file ({file_size_mb:.2f} MB) to GeoServer storage...")
+    except OSError:
+        # Handle cases where file might not exist yet (though unlikely here)
+        logger.warning(f"Copying file to GeoServer storage (Size unknown).")
+
+    logger.info(f"Source: {source_file}")
+    logger.info(f"Destination: {dest_path}")
+
+    result = copy_file(source_file, dest_path, verify_checksum=settings.STORAGE_COPY_VERIFY_CHECKSUM)
+    if result.ok:
+        rate = (result.size / (1024 * 1024)) / result.seconds if result.seconds > 0 else 0
+        logger.info(f"Copy complete ({result.method}, {result.seconds:.1f}s, {rate:.1f} MB/s).")
+    else:
+        logger.error(f"Failed to copy file to rclone mount: {result.error}")
+    return result
 
 
-def create_mosaic_footprint_as_line(files, raw_img_folder, flight_timestamp, image, engine, footprint, output_geopackage):
-    bboxes = create_img_bounding_boxes(files, raw_img_folder)
+def create_mosaic_footprint_as_line(files, raw_img_folder, flight_timestamp, image, engine, footprint, output_geopackage, index=None):
+    bboxes = create_img_bounding_boxes(files, raw_img_folder, index)
     minx, miny, maxx, maxy = bboxes.geometry.total_bounds
     # Create linestring
     points = [(minx, miny), (minx, maxy), (maxx, maxy), (maxx, miny), (minx, miny)]
@@ -217,46 +403,43 @@ def create_mosaic_footprint_as_line(files, raw_img_folder, flight_timestamp, ima
     footprint_line_layer = gpd.geodataframe.GeoDataFrame(data_dictionary, crs="EPSG:4326", geometry=line_geom)
     footprint_line_layer.to_postgis("hotspot_flight_footprints", engine, if_exists="append")
     footprint_poly_layer = gpd.geodataframe.GeoDataFrame(data_dictionary, crs="EPSG:4326", geometry=poly_geom)
-    footprint_poly_layer.to_file(output_geopackage, layer='footprint', driver="GPKG")
-
-def get_footprint_districts(footprint, output_geopackage):
-    districts_gdf = gpd.read_file(districts_gpkg, layer=districts_layer_name)
-    footprint_gdf = gpd.read_file(output_geopackage, layer='footprint')
-    for index, footprint_feature in footprint_gdf.iterrows():
+    with geopackage_lock:
+        footprint_poly_layer.to_file(output_geopackage, layer='footprint', driver="GPKG")
+
+def get_footprint_districts(footprint, output_geopackage=None):
+    # The districts layer stays loaded and indexed in this process, so this is an in-memory query
+    footprint_geom = footprint.as_poly
+    if footprint_geom is None:
+        # Fall back to the footprint written to the output geopackage
+        footprint_gdf = gpd.read_file(output_geopackage, layer='footprint')
         # Should only be one footprint in the layer
-        footprint_geom = footprint_feature['geometry']
-    for index, district in districts_gdf.iterrows():
-        if footprint_geom.intersects(district['geometry']):
-            footprint.districts.append(district['ADMIN_ZONE'].strip().replace(" ", "_"))
-
-def create_img_bbox_as_poly(image):
-    # Get coords of diagonal corners of output raster
-    working_image = gdal.Open(image)
-    ulx, uly, lrx, lry = get_corners(working_image)
-    working_image = None
-    # Create linestring
-    points = [(ulx, uly), (lrx, uly), (lrx, lry), (ulx, lry)]
-    poly = Polygon(points)
-    return str(poly)
-
-def create_img_bounding_boxes(files, raw_img_folder):
-    bbox_polys = []
-    files_columns = []
-    for file in files:
-        filename = os.path.basename(file)
-        #short_file = os.path.join(raw_img_folder, filename) files_columns.append([file, short_file])
-        files_columns.append([file, filename])
-        poly = create_img_bbox_as_poly(file)
-        bbox_polys.append(poly)
+        footprint_geom = footprint_gdf.geometry.iloc[-1]
+    district_lookup = get_district_lookup(districts_gpkg, districts_layer_name)
+    footprint.districts.extend(district_lookup.get_districts(footprint_geom))
+
+def create_img_bounding_boxes(files, raw_img_folder, index=None):
+    # Builds every image bounding box in one vectorised call from the raster header index,
+    # instead of one Shapely Polygon per image round-tripped through WKT.
+    if index is None:
+        index = RasterIndex.build(files, workers=settings.RASTER_INDEX_WORKERS)
+    corners = np.array([index[file].corners for file in files], dtype=float).reshape(-1, 4)
+    ulx, uly, lrx, lry = corners[:, 0], corners[:, 1], corners[:, 2], corners[:, 3]
+    # Same ring as before: (ulx, uly), (lrx, uly), (lrx, lry), (ulx, lry)
+    rings = np.stack([
+        np.column_stack([ulx, uly]),
+        np.column_stack([lrx, uly]),
+        np.column_stack([lrx, lry]),
+        np.column_stack([ulx, lry]),
+    ], axis=1)
     crs = "EPSG:28350"
-    geom = gpd.geoseries.GeoSeries([loads(poly) for poly in bbox_polys])
-    geom.crs = crs
-    bboxes = gpd.geodataframe.GeoDataFrame(files_columns, crs=crs, geometry=geom, columns=['file', 'short_file'])
+    geom = gpd.GeoSeries(shapely.polygons(rings), crs=crs)
+    files_columns = {"file": files, "short_file": [os.path.basename(file) for file in files]}
+    bboxes = gpd.geodataframe.GeoDataFrame(files_columns, crs=crs, geometry=geom)
     bboxes = bboxes.to_crs('EPSG:4326')
     return bboxes 
 
 def create_boundaries_and_centroids(flight_timestamp, kml_boundaries_file, bboxes, engine, output_geopackage):
-    all_images_with_hotspots = []
+    all_images_with_hotspots = set()
     try:
         # NB bboxes is a set of bounding boxes for each image (excluding the first, if exclude_first is True) gpd.io.file.fiona.drvsupport.supported_drivers['KML'] = 'rw' # Enables 
         # fiona KML driver
@@ -339,18 +522,18 @@ def create_boundaries_and_centroids(flight_timestamp, kml_boundaries_file, bboxe
         images_column = []
         flight_datetime_column = []
         hotspot_no_column = []
+        # Join every boundary envelope to the image bounding boxes it intersects in one bulk STRtree query,
+        # instead of testing each boundary against each image.
+        short_files = bboxes['short_file'].tolist()
+        tree = shapely.STRtree(list(bboxes.geometry))
+        boundary_indices, bbox_indices = tree.query(shapely.envelope(boundary_geometries), predicate='intersects')
+        # Keep the images of each boundary in the bounding boxes order
+        images_per_boundary = [[] for _ in boundary_geometries]
+        for boundary_index, bbox_index in sorted(zip(boundary_indices.tolist(), bbox_indices.tolist())):
+            images_per_boundary[boundary_index].append(short_files[bbox_index])
         i = 1
-        for geom in boundary_geometries:
-            envelope = geom.envelope
-            images = []
-            for index, row in bboxes.iterrows():
-                box = row['geometry']
-                file = row['file']
-                short_file = row['short_file']
-                if envelope.intersects(box):
-                    images.append(short_file)
-                    if short_file not in all_images_with_hotspots:
-                        all_images_with_hotspots.append(short_file)
+        for geom, images in zip(boundary_geometries, images_per_boundary):
+            all_images_with_hotspots.update(images)
             if len(images) > 0:
                 included_geometries.append(geom)
                 centroid_geometries.append(geom.centroid)
@@ -362,11 +545,13 @@ def create_boundaries_and_centroids(flight_timestamp, kml_boundaries_file, bboxe
         crs="EPSG:4283"
         boundaries = gpd.geodataframe.GeoDataFrame(data_dictionary, crs=crs, geometry=included_geometries)
         boundaries = boundaries.to_crs('EPSG:4326')
-        boundaries.to_file(output_geopackage, layer='boundaries', driver="GPKG")
+        with geopackage_lock:
+            boundaries.to_file(output_geopackage, layer='boundaries', driver="GPKG")
         boundaries.to_postgis("hotspot_boundaries", engine, if_exists="append")
         centroids = gpd.geodataframe.GeoDataFrame(data_dictionary, crs=crs, geometry=centroid_geometries)
         centroids = centroids.to_crs('EPSG:4326')
-        centroids.to_file(output_geopackage, layer='centroids', driver="GPKG")
+        with geopackage_lock:
+            centroids.to_file(output_geopackage, layer='centroids', driver="GPKG")
         centroids.to_postgis("hotspot_centroids", engine, if_exists="append")
     except Exception as e:
         logger.error(f"An unexpected error occurred in create_boundaries_and_centroids: {e}", exc_info=True)
@@ -392,81 +577,74 @@ def send_notification_emails(flight_name, success, msg, districts=[]):
                 Subject='New Thermal Image data available',
                 HtmlBody='Automated email advising that a new dataset,' + flight_name + ', has arrived and has been successfully processed; it can be viewed in SSS.<br>' + msg)
 
+_postgis_engine = None
+_postgis_engine_lock = threading.Lock()
+
+def get_postgis_engine():
+    # One engine (and so one connection pool) per process, reused by every flight a worker processes
+    global _postgis_engine
+    with _postgis_engine_lock:
+        if _postgis_engine is None:
+            _postgis_engine = create_engine(postgis_table, pool_pre_ping=True)
+        return _postgis_engine
+
+_geoserver_publisher = None
+_geoserver_publisher_lock = threading.Lock()
+
+def get_geoserver_publisher():
+    # One publisher (and so one keep-alive connection pool) per process
+    global _geoserver_publisher
+    with _geoserver_publisher_lock:
+        if _geoserver_publisher is None:
+            file_url_base = os.environ.get('general_file_url_base', 'file:///rclone-mounts/thermalimaging-flightmosaics/')
+            gs_url_base = os.environ.get('general_gs_url_base','https://hotspots.dbca.wa.gov.au/geoserver/rest/workspaces/hotspots/coveragestores/')
+            logger.info(f'gs_url_base: {gs_url_base}')
+            _geoserver_publisher = GeoServerPublisher(
+                gs_url_base,
+                file_url_base,
+                user,
+                gs_pwd,
+                max_workers=settings.GEOSERVER_PUBLISH_WORKERS,
+                timeout=(settings.GEOSERVER_CONNECT_TIMEOUT, settings.GEOSERVER_READ_TIMEOUT),
+            )
+        return _geoserver_publisher
+
+def store_image_mosaic_config(flight_name, output_folder):
+    """
+    Writes the ImageMosaic configuration of the flight's hotspot images and copies it next to them on GeoServer storage.
+    Returns the CopyResult of each copied file.
+    """
+    config_folder = os.path.join(output_folder, "imagemosaic")
+    os.makedirs(config_folder, exist_ok=True)
+    copied = []
+    for file_name, content in get_image_mosaic_config(get_image_mosaic_name(flight_name)).items():
+        local_path = os.path.join(config_folder, file_name)
+        with open(local_path, 'w') as f:
+            f.write(content)
+        copy_result = copy_to_geoserver_storage(local_path, flight_name + "_images/" + file_name)
+        if not copy_result.ok:
+            raise RuntimeError(f"Failed to copy ImageMosaic configuration {file_name} to GeoServer storage: {copy_result.error}")
+        copied.append(copy_result)
+    return copied
+
 def publish_image_on_geoserver(flight_name, image_name=None):
     logger.info(f'Publishing to GeoServer... Flight: {flight_name}, Image: {image_name}')
-
-    flight_timestamp = flight_name.replace("FireFlight_", "")
-    headers = {'Content-type': 'application/xml'}
-    file_url_base = os.environ.get('general_file_url_base', 'file:///rclone-mounts/thermalimaging-flightmosaics/')
-    gs_url_base = os.environ.get('general_gs_url_base','https://hotspots.dbca.wa.gov.au/geoserver/rest/workspaces/hotspots/coveragestores/')
-
-    logger.info(f'gs_url_base: {gs_url_base}')
-
-    if image_name is None:
-        gs_layer_url = gs_url_base + flight_name + '.tif/coverages'
-    else:
-        gs_layer_url = gs_url_base + flight_timestamp + '_img_' + image_name + '/coverages'
-
-    # Create data store on geoserver
-    if image_name is None:
-        store_data = '<coverageStore><name>{flight_name}.tif</name><workspace>hotspots</workspace><enabled>true</enabled><type>GeoTIFF</type><url>{file_url_base}{flight_name}.tif</url></coverageStore>'.format(flight_name=flight_name, file_url_base=file_url_base)
-    else:
-        store_data = '<coverageStore><name>{flight_timestamp}_img_{image}</name><workspace>hotspots</workspace><enabled>true</enabled><type>GeoTIFF</type><url>{file_url_base}{flight_name}_images/{image_name}</url></coverageStore>'.format(flight_name=flight_name, flight_timestamp=flight_timestamp, file_url_base=file_url_base, image=image_name, image_name=image_name)
-    
-    # --- Create Coverage Store ---
-    try:
-        response = requests.post(gs_url_base, headers=headers, data=store_data, auth=(user, gs_pwd))
-        if response.status_code in [200, 201]:
-            logger.info(f"Coverage Store created successfully. (Status {response.status_code})")
-        elif response.status_code == 500 and "already exists" in response.text:
-            # Not strictly an error if we are updating or reprocessing
-            logger.info(f"Coverage Store already exists. Status: {response.status_code}")
-        else:
-            logger.error(f"Failed to create Coverage Store. Status: {response.status_code}, Response: {response.text}")
-    except Exception as e:
-        logger.error(f"Exception during Coverage Store creation: {e}", exc_info=True)
-    
     if image_name is None:
-        target_layer_name = flight_name
+        item = get_mosaic_item(flight_name)
     else:
-        # e.g. 20231214_..._img_00001
-        target_layer_name = f"{flight_timestamp}_img_{image_name[:-4]}"
-
-    layer_data = f'<coverage><name>{target_layer_name}</name><title>{target_layer_name}</title><srs>EPSG:28350</srs></coverage>'
-
-    # --- Create/Publish Layer ---
-    try:
-        response = requests.post(gs_layer_url, headers=headers, data=layer_data, auth=(user, gs_pwd))
-
-        if response.status_code == 201:
-            success_message = f'Great success! Layer published on GeoServer: {target_layer_name}.'
-            logger.info(success_message)
-        elif response.status_code == 500 and "already exists" in response.text:
-            success_message = f'Layer already exists on GeoServer (Status 500). Skipping: {target_layer_name}.'
-            logger.info(success_message)
-        else:
-            error_msg = f"Error GeoServer Layer Publish for {target_layer_name}. Status: {response.status_code}"
-            logger.error(error_msg)
-            logger.error(f"Response: {response.text}")
-            print(f"Response: {response.text}")
-    except Exception as e:
-        error_msg = f"Exception during Layer publication: {e}"
-        logger.error(error_msg, exc_info=True)
+        item = get_hotspot_image_item(flight_name, image_name)
+    return get_geoserver_publisher().publish_many([item])
 
 def unzip_and_prepare(full_filename_path):
     """
-    Handles file preparation: copying, moving, and unzipping.
+    Handles file preparation: moving and unzipping.
     Replaces the functionality of the shell script.
     """
     # Get the base directory of the project
     # base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     
     filename = os.path.basename(full_filename_path)
-    
-    # Logic to determine directory name (Removing extension and timestamp)
-    basename_without_ext = os.path.splitext(filename)[0]
-    # Assuming format Name.timestamp -> Name
-    dirname = os.path.splitext(basename_without_ext)[0]
+    dirname = get_flight_dirname(filename)
 
     logger.info(f"Preparing to process: {filename}")
     logger.info(f"Target directory name: {dirname}")
@@ -478,14 +656,7 @@ def unzip_and_prepare(full_filename_path):
     if not os.path.exists(processing_base_folder):
         os.makedirs(processing_base_folder)
 
-    # Path for the temporary 7z file in processing folder
-    target_7z_path = os.path.join(processing_base_folder, filename)
-
-    # 1. Copy file to processing folder
-    logger.info(f"Copying {full_filename_path} to {target_7z_path}")
-    shutil.copy2(full_filename_path, target_7z_path)
-
-    # 2. Move original file to uploads history folder
+    # 1. Move original file to uploads history folder
     # Ensure uploads_folder_path is absolute
     # if not os.path.isabs(uploads_folder_path):
     #     uploads_folder_path = os.path.join(base_dir, uploads_folder_path)
@@ -498,47 +669,99 @@ def unzip_and_prepare(full_filename_path):
          
     shutil.move(full_filename_path, dest_move_path)
 
-    # 3. Unzip using 7z
-    logger.info(f"Uncompressing {filename}...")
+    # 2. Extract straight from the uploads history copy (no temporary copy in the processing folder)
+    extract_archive(dest_move_path, processing_base_folder)
+
+    # Return the full path to the extracted directory
+    return os.path.join(processing_base_folder, dirname)
+
+def get_flight_dirname(filename):
+    # Logic to determine directory name (Removing extension and timestamp)
+    basename_without_ext = os.path.splitext(filename)[0]
+    # Assuming format Name.timestamp -> Name
+    return os.path.splitext(basename_without_ext)[0]
+
+def extract_archive(archive_path, dest_folder):
+    """
+    Extracts the whole archive with 7z, or with ARCHIVE_EXTRACTION=selective only the PNGs and KML boundaries the pipeline reads.
+    """
+    logger.info(f"Uncompressing {os.path.basename(archive_path)}...")
+    if settings.ARCHIVE_EXTRACTION == "selective":
+        result = extract_required_members(archive_path, dest_folder, settings.ARCHIVE_EXTRACTION_WORKERS)
+        logger.info(f"Selective extraction: {result.summary()}")
+        return
+    start = time.monotonic()
     try:
         # -aoa: Overwrite All existing files without prompt
         subprocess.run(
-            ['7z', 'x', target_7z_path, '-aoa'],
-            cwd=processing_base_folder, # Execute inside thermal_data_processing
+            ['7z', 'x', archive_path, '-aoa'],
+            cwd=dest_folder, # Execute inside thermal_data_processing
             check=True,
             capture_output=True
         )
     except subprocess.CalledProcessError as e:
         logger.error(f"7z extraction failed: {e.stderr.decode()}")
         raise
+    logger.info(f"Full extraction completed in {time.monotonic() - start:.1f}s")
 
-    # 4. Remove the temporary .7z file
-    os.remove(target_7z_path)
+def prepare_archive(full_filename_path):
+    """
+    File preparation without extraction (INGEST_MODE=archive): moves the upload to the uploads history
+    folder and returns (flight folder, source root). The pipeline reads its inputs from the source root,
+    a GDAL path inside the archive, and only writes its outputs to the flight folder under DATA_STORAGE.
+    If GDAL cannot read the archive, it is extracted from the history folder instead and the source root is None.
+    """
+    filename = os.path.basename(full_filename_path)
+    dirname = get_flight_dirname(filename)
+    flight_path = os.path.join(settings.DATA_STORAGE, dirname)
 
-    # Return the full path to the extracted directory
-    return os.path.join(processing_base_folder, dirname)
+    logger.info(f"Preparing to process: {filename} (from archive)")
+    logger.info(f"Target directory name: {dirname}")
+
+    dest_move_path = os.path.join(settings.UPLOADS_HISTORY_PATH, filename)
+    logger.info(f"Moving original file to {dest_move_path}")
+    os.makedirs(settings.UPLOADS_HISTORY_PATH, exist_ok=True)
+    shutil.move(full_filename_path, dest_move_path)
+
+    source_root = get_archive_root(dest_move_path, dirname)
+    if source_root is None or not path_exists(source_root):
+        # e.g. a .7z with a GDAL older than 3.7, or an archive without a top-level flight folder
+        logger.warning(f"Cannot read {filename} in place, extracting it instead.")
+        os.makedirs(settings.DATA_STORAGE, exist_ok=True)
+        extract_archive(dest_move_path, settings.DATA_STORAGE)
+        return flight_path, None
+
+    os.makedirs(flight_path, exist_ok=True)
+    logger.info(f"Reading flight inputs from: {source_root}")
+    return flight_path, source_root
 
 
 # =========================================================
 # Main processing logic wrapper
 # =========================================================
-def run_thermal_processing(flight_path_arg):
+def run_thermal_processing(flight_path_arg, source_root=None):
     """
-    Main entry point for thermal image processing.
+    Main entry point for thermal image processing. Returns whether the processing succeeded.
+    source_root: where to read the flight inputs from if not flight_path_arg,
+    e.g. the flight folder inside the uploaded archive (see prepare_archive).
     """
     # Argument is now the full path
     flight_name = os.path.basename(flight_path_arg)
     flight_timestamp = flight_name.replace("FireFlight_", "")
-    main_folder = flight_path_arg
+    main_folder = source_root or flight_path_arg
 
     # Set filepaths
     raw_img_folder = os.path.join(main_folder, "PNGs/CAMERA1")
-    output_folder = os.path.join(main_folder, "Processed")
+    # Outputs always go to the flight folder, also when the inputs are read from the archive
+    output_folder = os.path.join(flight_path_arg, "Processed")
+    local_img_folder = os.path.join(flight_path_arg, "PNGs/CAMERA1")
     mosaic_image = os.path.join(output_folder, flight_name + "_mosaic" + output_image_file_ext)
+    mosaic_vrt = os.path.join(output_folder, flight_name + "_mosaic.vrt")
     footprint = Footprint()
     kml_boundaries_folder = os.path.join(main_folder, "KML Boundaries/CAMERA1")
     kml_boundaries_file =""
     output_geopackage = os.path.join(output_folder, "output.gpkg")
+    raster_index_sidecar = os.path.join(output_folder, "raster_index.json")
 
     # =========================================================
     # FIX: Dynamically add a FileHandler for this specific flight
@@ -577,13 +800,13 @@ def run_thermal_processing(flight_path_arg):
 
     try:
         logger.info(f"Looking for KML in: {kml_boundaries_folder}")
-        if os.path.exists(kml_boundaries_folder):
-            for filename in os.listdir(kml_boundaries_folder):
+        if path_exists(kml_boundaries_folder):
+            for filename in list_dir(kml_boundaries_folder):
                 if "supermosaic_" in filename.lower() and filename.lower().endswith("bnd.kml"):
                     kml_boundaries_file = os.path.join(kml_boundaries_folder, filename)
                     break
             if kml_boundaries_file == "":
-                for filename in os.listdir(kml_boundaries_folder):
+                for filename in list_dir(kml_boundaries_folder):
                     if filename.lower() == "mosaic_0_0_bnd.kml":
                         kml_boundaries_file = os.path.join(kml_boundaries_folder, filename)
                         break
@@ -591,102 +814,193 @@ def run_thermal_processing(flight_path_arg):
         if kml_boundaries_file == "":
             raise FileNotFoundError("Critical Error: No file named *SuperMosaic*BND.kml found in KML Boundaries folder.")
 
-        engine = create_engine(postgis_table)
+        engine = get_postgis_engine()
         
+        if not os.path.exists(output_folder):
+            os.makedirs(output_folder)
+
         exclude_first = None
-        if os.path.exists(raw_img_folder):
-            files = [os.path.join(raw_img_folder, f) for f in os.listdir(raw_img_folder) if f.endswith(input_image_file_ext)]
+        if path_exists(raw_img_folder):
+            files = [os.path.join(raw_img_folder, f) for f in list_dir(raw_img_folder) if f.endswith(input_image_file_ext)]
             files.sort()
-            exclude_first = get_exclude_first(files)
+            # Read every image header once; all the steps below use this index instead of reopening the PNGs
+            logger.info(f"Indexing raster headers of {len(files)} images...")
+            raster_index = RasterIndex.build(files, raster_index_sidecar, settings.RASTER_INDEX_WORKERS)
+            exclude_first = get_exclude_first(files, raster_index)
             if exclude_first:
                 files.remove(files[0])
         else:
             # Raise an error if the image folder is missing.
             raise FileNotFoundError(f"Raw image folder not found: {raw_img_folder}")
-
-        if not os.path.exists(output_folder):
-            os.makedirs(output_folder)
         
-        all_images_with_hotspots = []
-        mosaic_stored_ok = False
-
-        # --- Log: Mosaic Creation ---
-        logger.info(">>> Step 1/8: Creating Mosaic Image (gdal.Warp)...")
-        # Pass output path explicitly
-        merge(files, mosaic_image)
-        msg += "\nMosaic produced OK"
-        logger.info("Mosaic produced OK")
-
-        # Wait a bit
-        time.sleep(10)
-
-        # --- Log: File Copy/Upload ---
-        logger.info(">>> Step 2/8: Copying Mosaic to GeoServer Storage...")
-        copy_to_geoserver_storage(mosaic_image, flight_name + ".tif")
-        msg += "\nMosaic pushed to GeoServer storage OK"
-        logger.info("Mosaic pushed to GeoServer storage OK")
-        mosaic_stored_ok = True
-
-        # --- Log: Footprint Creation ---
-        logger.info(">>> Step 3/8: Creating Footprint and pushing to PostGIS...")
-        create_mosaic_footprint_as_line(files, raw_img_folder, flight_timestamp, mosaic_image, engine, footprint, output_geopackage)
-        msg += "\nFootprint produced and pushed to PostGIS OK"
-        logger.info('Footprint produced and pushed to PostGIS OK') 
-
-        # --- Log: District Check ---
-        logger.info(">>> Step 4/8: Checking Districts...")
-        get_footprint_districts(footprint, output_geopackage)
-        msg += "\nFootprint lies in district(s) " + str(footprint.districts)
-        logger.info("Footprint lies in district(s) " + str(footprint.districts))
-
-        # --- Log: Bounding Boxes ---
-        logger.info(">>> Step 5/8: Creating Image Bounding Boxes...")
-        bboxes = create_img_bounding_boxes(files, raw_img_folder)
-        msg += "\nBounding box creation for images OK"
-        logger.info('Bounding box creation for images OK')
-
-        # --- Log: Hotspot Analysis ---
-        logger.info(">>> Step 6/8: Analyzing Hotspots (Intersects)...")
-        all_images_with_hotspots = create_boundaries_and_centroids(flight_timestamp, kml_boundaries_file, bboxes, engine, output_geopackage)
-        if not all_images_with_hotspots:
-            msg += "\nNO HOTSPOTS FOUND!!!"
-            logger.info("NO HOTSPOTS FOUND!!!")
-        else:
-            msg += "\nBoundaries and centroids creation and push to PostGIS OK"
-            logger.info("Boundaries and centroids creation and push to PostGIS OK")
-
-        # --- Log: Image Conversion ---
-        count = len(all_images_with_hotspots)
-        logger.info(f">>> Step 7/8: Converting {count} Hotspot Images (PNG to TIF)...")
-        if len(all_images_with_hotspots) > 0:
-            for img in all_images_with_hotspots:
-                full_path = os.path.join(raw_img_folder, img)
-                translate_png2tif(full_path, img, flight_name)
-            msg += "\nProduction of tif images OK"
-            logger.info("Production of tif images OK")
-
-        # Wait for storage sync
-        time.sleep(60)
-
-        # --- Log: GeoServer Publishing ---
-        logger.info(">>> Step 8/8: Publishing to GeoServer...")
-        if mosaic_stored_ok:
-            publish_image_on_geoserver(flight_name)
-            msg += "\nMosaic published on geoserver OK"
-            logger.info("Mosaic published on geoserver OK")
-        else:
-            # This is not an exception, but a known non-critical issue.
-            # We log it and add it to the message, but let the process continue.
-            msg += "\nWarning: Mosaic was not stored, so it could not be published on geoserver."
-            logger.warning("Mosaic was not stored, so it could not be published on geoserver.")
-
-        for img in all_images_with_hotspots:
-            img = img.replace(".png", ".tif")
-            publish_image_on_geoserver(flight_name, img)
+        # The eight steps form a dependency graph. Only the bounding boxes run alongside the warp: the footprint and
+        # hotspot steps append to PostGIS and copy to GeoServer storage, so they wait for the mosaic, and a flight whose
+        # mosaic fails leaves no rows behind to be duplicated when it is processed again.
+        pipeline = Pipeline(settings.PIPELINE_MAX_WORKERS)
+        # CopyResult of every file copied to GeoServer storage, checked for visibility before publishing
+        copied_files = []
+
+        @pipeline.stage("mosaic")
+        def mosaic_stage(results):
+            if settings.MOSAIC_MODE == "vrt":
+                # --- Log: Virtual Mosaic Creation ---
+                logger.info(">>> Step 1/8: Creating Virtual Mosaic (gdal.BuildVRT)...")
+                build_virtual_mosaic(files, mosaic_vrt)
+                pipeline.report("mosaic", "Virtual mosaic produced OK")
+                logger.info("Virtual mosaic produced OK")
+            else:
+                # --- Log: Mosaic Creation ---
+                logger.info(">>> Step 1/8: Creating Mosaic Image (gdal.Warp)...")
+                # Pass output path explicitly
+                with warp_slot():
+                    merge(files, mosaic_image, raster_index)
+                pipeline.report("mosaic", "Mosaic produced OK")
+                logger.info("Mosaic produced OK")
+
+        @pipeline.stage("store_mosaic", requires=["mosaic"])
+        def store_mosaic_stage(results):
+            # Returns whether the mosaic was stored on GeoServer storage
+            if settings.MOSAIC_MODE == "vrt":
+                if settings.MOSAIC_VRT_MATERIALISE != "background":
+                    logger.info(">>> Step 2/8: Mosaic materialisation deferred until requested (materialise_mosaic_command).")
+                    return False
+                logger.info(">>> Step 2/8: Materialising virtual mosaic...")
+                with warp_slot():
+                    materialise_mosaic(mosaic_vrt, mosaic_image)
+                pipeline.report("store_mosaic", "Mosaic materialised from virtual mosaic OK")
+
+            # --- Log: File Copy/Upload ---
+            logger.info(">>> Step 2/8: Copying Mosaic to GeoServer Storage...")
+            copy_result = copy_to_geoserver_storage(mosaic_image, flight_name + ".tif")
+            if not copy_result.ok:
+                pipeline.report("store_mosaic", f"Warning: Mosaic could not be copied to GeoServer storage: {copy_result.error}")
+                return False
+            copied_files.append(copy_result)
+            pipeline.report("store_mosaic", "Mosaic pushed to GeoServer storage OK")
+            logger.info("Mosaic pushed to GeoServer storage OK")
+            return True
+
+        @pipeline.stage("footprint", requires=["mosaic"])
+        def footprint_stage(results):
+            # --- Log: Footprint Creation ---
+            logger.info(">>> Step 3/8: Creating Footprint and pushing to PostGIS...")
+            create_mosaic_footprint_as_line(files, raw_img_folder, flight_timestamp, mosaic_image, engine, footprint, output_geopackage, raster_index)
+            pipeline.report("footprint", "Footprint produced and pushed to PostGIS OK")
+            logger.info('Footprint produced and pushed to PostGIS OK') 
+
+        @pipeline.stage("districts", requires=["footprint"])
+        def districts_stage(results):
+            # --- Log: District Check ---
+            logger.info(">>> Step 4/8: Checking Districts...")
+            get_footprint_districts(footprint, output_geopackage)
+            pipeline.report("districts", "Footprint lies in district(s) " + str(footprint.districts))
+            logger.info("Footprint lies in district(s) " + str(footprint.districts))
+
+        @pipeline.stage("bboxes")
+        def bboxes_stage(results):
+            # --- Log: Bounding Boxes ---
+            logger.info(">>> Step 5/8: Creating Image Bounding Boxes...")
+            bboxes = create_img_bounding_boxes(files, raw_img_folder, raster_index)
+            pipeline.report("bboxes", "Bounding box creation for images OK")
+            logger.info('Bounding box creation for images OK')
+            return bboxes
+
+        @pipeline.stage("hotspots", requires=["mosaic", "bboxes"])
+        def hotspots_stage(results):
+            # --- Log: Hotspot Analysis ---
+            logger.info(">>> Step 6/8: Analyzing Hotspots (Intersects)...")
+            all_images_with_hotspots = create_boundaries_and_centroids(flight_timestamp, kml_boundaries_file, results["bboxes"], engine, output_geopackage)
+            if not all_images_with_hotspots:
+                pipeline.report("hotspots", "NO HOTSPOTS FOUND!!!")
+                logger.info("NO HOTSPOTS FOUND!!!")
+            else:
+                pipeline.report("hotspots", "Boundaries and centroids creation and push to PostGIS OK")
+                logger.info("Boundaries and centroids creation and push to PostGIS OK")
+            return all_images_with_hotspots
+
+        @pipeline.stage("hotspot_tifs", requires=["hotspots"])
+        def hotspot_tifs_stage(results):
+            all_images_with_hotspots = results["hotspots"]
+            # --- Log: Image Conversion ---
+            count = len(all_images_with_hotspots)
+            logger.info(f">>> Step 7/8: Converting {count} Hotspot Images (PNG to TIF)...")
+            converted_images = []
+            if len(all_images_with_hotspots) > 0:
+                converted, failed = convert_hotspot_images(all_images_with_hotspots, raw_img_folder, flight_name, settings.HOTSPOT_CONVERSION_WORKERS, local_img_folder)
+                for img, copy_result in converted:
+                    copied_files.append(copy_result)
+                    converted_images.append(img)
+                if failed:
+                    failed_list = "".join(f"\n  {img}: {error}" for img, error in sorted(failed.items()))
+                    pipeline.report("hotspot_tifs", f"Warning: {len(failed)} of {count} tif images could not be produced:{failed_list}")
+                    logger.warning(f"{len(failed)} of {count} tif images could not be produced:{failed_list}")
+                if converted:
+                    pipeline.report("hotspot_tifs", "Production of tif images OK")
+                    logger.info("Production of tif images OK")
+                    if settings.GEOSERVER_HOTSPOT_PUBLISH_MODE == "imagemosaic":
+                        copied_files.extend(store_image_mosaic_config(flight_name, output_folder))
+            return converted_images
+
+        @pipeline.stage("publish", requires=["store_mosaic", "hotspot_tifs"])
+        def publish_stage(results):
+            # Only the hotspot images that were converted and copied can be published
+            all_images_with_hotspots = results["hotspot_tifs"]
+            mosaic_stored_ok = results["store_mosaic"]
+
+            # Wait for storage sync: poll the copied files until they are visible on the mount
+            not_visible = wait_until_visible(copied_files, settings.STORAGE_SYNC_TIMEOUT, settings.STORAGE_SYNC_VERIFY_CHECKSUM)
+            if not_visible:
+                pipeline.report("publish", f"Warning: {len(not_visible)} file(s) were not visible on GeoServer storage after {settings.STORAGE_SYNC_TIMEOUT}s and were not published.")
+                # Do not register stores for files GeoServer cannot read yet
+                if os.path.join(settings.GEOSERVER_STORAGE_PATH, flight_name + ".tif") in not_visible:
+                    mosaic_stored_ok = False
+                all_images_with_hotspots = [
+                    img for img in all_images_with_hotspots
+                    if os.path.join(settings.GEOSERVER_STORAGE_PATH, flight_name + "_images/", img.replace(".png", ".tif")) not in not_visible
+                ]
+
+            # --- Log: GeoServer Publishing ---
+            logger.info(">>> Step 8/8: Publishing to GeoServer...")
+            publisher = get_geoserver_publisher()
+            if mosaic_stored_ok:
+                mosaic_result = publisher.publish_many([get_mosaic_item(flight_name)])
+                if mosaic_result.failed:
+                    pipeline.report("publish", "Warning: Mosaic could not be published on geoserver.")
+                else:
+                    pipeline.report("publish", "Mosaic published on geoserver OK")
+                    logger.info("Mosaic published on geoserver OK")
+            elif settings.MOSAIC_MODE == "vrt" and settings.MOSAIC_VRT_MATERIALISE != "background":
+                pipeline.report("publish", "Mosaic left as a virtual mosaic; run materialise_mosaic_command to publish it on geoserver.")
+                logger.info("Mosaic left as a virtual mosaic; run materialise_mosaic_command to publish it on geoserver.")
+            else:
+                # This is not an exception, but a known non-critical issue.
+                # We log it and add it to the message, but let the process continue.
+                pipeline.report("publish", "Warning: Mosaic was not stored, so it could not be published on geoserver.")
+                logger.warning("Mosaic was not stored, so it could not be published on geoserver.")
+
+            if all_images_with_hotspots and settings.GEOSERVER_HOTSPOT_PUBLISH_MODE == "imagemosaic":
+                # One ImageMosaic store and layer for all the hotspot images of the flight
+                mosaic_name = get_image_mosaic_name(flight_name)
+                try:
+                    publisher.publish_image_mosaic(mosaic_name, flight_name + "_images/")
+                    pipeline.report("publish", f"Published {len(all_images_with_hotspots)} hotspot images to geoserver as ImageMosaic layer {mosaic_name} OK.")
+                    logger.info(f"Published {len(all_images_with_hotspots)} hotspot images to geoserver as ImageMosaic layer {mosaic_name} OK.")
+                except GeoServerError as e:
+                    logger.error(str(e))
+                    pipeline.report("publish", f"Warning: hotspot images ImageMosaic {mosaic_name} could not be published: {e}")
+            elif all_images_with_hotspots:
+                items = [get_hotspot_image_item(flight_name, img.replace(".png", ".tif")) for img in all_images_with_hotspots]
+                images_result = publisher.publish_many(items)
+                pipeline.report("publish", f"Hotspot images on geoserver: {images_result.summary()}.")
+                if images_result.failed:
+                    failed_list = "".join(f"\n  {layer}" for layer in sorted(images_result.failed))
+                    pipeline.report("publish", f"Warning: these hotspot images could not be published:{failed_list}")
 
-        if all_images_with_hotspots:
-            msg += f"\nPublished {len(all_images_with_hotspots)} individual hotspot images to geoserver OK."
-            logger.info(f"Published {len(all_images_with_hotspots)} individual hotspot images to geoserver OK.")
+        try:
+            pipeline.run()
+        finally:
+            # Keep the messages of every stage that completed, also when another one failed
+            msg += pipeline.get_message()
 
     except Exception as e:
         # If ANY of the steps in the 'try' block fails, the code will jump directly here.
@@ -722,6 +1036,8 @@ def run_thermal_processing(flight_path_arg):
             logger.removeHandler(file_handler)
             file_handler.close()
 
+    return success
+
 # =========================================================
 # Legacy Support: Allows running from command line (like .sh)
 # =========================================================
@@ -0,0 +1,133 @@
+"""
+Cached directory sizes for the file browser.
+
+Walking a flight folder and stating its tens of thousands of PNGs on every page
+load is slow, so directory sizes are kept in the Django cache. Listings only
+ever read the cache: they never walk a tree, as the web workers are gevent
+workers and a blocking walk would stall every request they serve.
+
+The sizes are computed off the request path. refresh_dir_size walks a tree once,
+stating every file, and stores a single cache entry for it holding the size and
+mtime of every directory in it, so browsing into a flight's subfolders needs no
+further entries (and a few hundred flights stay well within the cache's
+MAX_ENTRIES). The trees are the folders directly under DATA_STORAGE and
+UPLOADS_HISTORY_PATH. The import pipeline marks a flight folder stale when it
+starts writing into it and refreshes it when it is done, and
+refresh_dir_sizes_command (cron) refreshes the trees whose sizes are missing or
+stale.
+
+A cached size is fresh when its tree has not been marked stale, the directory's
+mtime is the one recorded and the entry is younger than DIR_SIZE_CACHE_MAX_AGE.
+Files growing in place do not change any directory's mtime, so the age limit is
+what bounds how long such a change can go unnoticed. Otherwise listings get the
+cached size (or 0) flagged as approximate.
+"""
+# Third-Party
+import os
+import time
+import hashlib
+import logging
+from django.core.cache import cache
+# Local
+from tipapp import settings
+
+logger = logging.getLogger(__name__)
+
+
+def get_cache_key(dir_path):
+    return "dir_size:" + hashlib.sha1(os.path.abspath(dir_path).encode()).hexdigest()
+
+
+def get_tree_root(dir_path):
+    """
+    Returns the folder whose cache entry holds dir_path's size: the folder directly under DATA_STORAGE
+    or UPLOADS_HISTORY_PATH that contains it (dir_path itself anywhere else).
+    """
+    dir_path = os.path.abspath(dir_path)
+    for base_path in [settings.DATA_STORAGE, settings.UPLOADS_HISTORY_PATH]:
+        base_path = os.path.abspath(base_path)
+        relative_path = os.path.relpath(dir_path, base_path)
+        if relative_path != "." and not relative_path.startswith(".."):
+            return os.path.join(base_path, relative_path.split(os.sep)[0])
+    return dir_path
+
+
+def is_fresh(entry, relative_path, mtime_ns):
+    return (
+        entry is not None
+        and not entry.get("stale")
+        and entry["dirs"].get(relative_path, (None, None))[1] == mtime_ns
+        and time.time() - entry["computed"] < settings.DIR_SIZE_CACHE_MAX_AGE
+    )
+
+
+def refresh_dir_size(dir_path):
+    """
+    Walks dir_path, stating every file, and caches the sizes of it and of every directory under it
+    in a single entry. Returns its size.
+    """
+    computed = time.time()
+    dirs_sizes = {}
+    # Bottom-up, so the subdirectory totals are known when their parent is reached
+    for root, dirs, files in os.walk(dir_path, topdown=False):
+        try:
+            mtime_ns = os.stat(root).st_mtime_ns
+        except OSError:
+            # Removed during the walk
+            continue
+        relative_path = os.path.relpath(root, dir_path)
+        total = sum(dirs_sizes.get(os.path.normpath(os.path.join(relative_path, name)), (0, None))[0] for name in dirs)
+        for name in files:
+            try:
+                total += os.stat(os.path.join(root, name), follow_symlinks=False).st_size
+            except OSError:
+                pass
+        dirs_sizes[relative_path] = (total, mtime_ns)
+    cache.set(get_cache_key(dir_path), {"computed": computed, "dirs": dirs_sizes}, timeout=None)
+    return dirs_sizes.get(".", (0, None))[0]
+
+
+def mark_stale(dir_path):
+    # Listings show the tree's sizes as approximate until the next refresh
+    key = get_cache_key(dir_path)
+    entry = cache.get(key)
+    if entry is not None:
+        entry["stale"] = True
+        cache.set(key, entry, timeout=None)
+
+
+def refresh_stale_dir_sizes(base_path):
+    """
+    Refreshes the directories directly under base_path whose cached size is missing or not fresh. Returns their paths.
+    """
+    refreshed = []
+    with os.scandir(base_path) as entries:
+        directories = [entry for entry in entries if entry.is_dir(follow_symlinks=False)]
+    for entry in directories:
+        try:
+            if is_fresh(cache.get(get_cache_key(entry.path)), ".", entry.stat().st_mtime_ns):
+                continue
+            refresh_dir_size(entry.path)
+            refreshed.append(entry.path)
+        except Exception as e:
+            logger.error(f"Error refreshing the size of directory {entry.path}: {e}", exc_info=True)
+    return refreshed
+
+
+def get_dir_size(dir_path, mtime_ns=None):
+    """
+    Returns (size, approximate) for dir_path from the cache, without walking it. mtime_ns: the directory's
+    st_mtime_ns if already known.
+    """
+    root = get_tree_root(dir_path)
+    relative_path = os.path.relpath(os.path.abspath(dir_path), root)
+    entry = cache.get(get_cache_key(root))
+    if mtime_ns is None:
+        try:
+            mtime_ns = os.stat(dir_path).st_mtime_ns
+        except OSError:
+            return 0, False
+    if is_fresh(entry, relative_path, mtime_ns):
+        return entry["dirs"][relative_path][0], False
+    size = entry["dirs"].get(relative_path, (0, None))[0] if entry is not None else 0
+    return size, True
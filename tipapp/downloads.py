@@ -0,0 +1,186 @@
+"""
+Downloads of thermal files and folders.
+
+Folders are streamed as ZIP archives produced while the folder is walked: each
+block read from disk is compressed (or stored) and handed to the response
+straight away, so memory stays flat whatever the folder size and the first
+bytes leave immediately. Members are written with data descriptors (the
+response is not seekable) and ZIP64 records where needed, so folders and files
+over 4 GB are fine.
+
+Single files support conditional requests (ETag / Last-Modified) and single
+byte ranges, so an interrupted download resumes where it stopped. With
+DOWNLOAD_OFFLOAD_HEADER set, the transfer itself is handed to the front-end
+server (nginx X-Accel-Redirect, Apache/lighttpd X-Sendfile), which then also
+handles the ranges; the view only does the path checks.
+"""
+# Third-Party
+import os
+import re
+import zipfile
+import logging
+from urllib.parse import quote
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+# Local
+from tipapp import settings
+
+logger = logging.getLogger(__name__)
+
+READ_BLOCK_SIZE = 1024 * 1024
+# Already compressed formats are stored as they are: deflating them again costs CPU for nothing
+STORED_EXTENSIONS = ('.png', '.tif', '.tiff', '.jpg', '.jpeg', '.zip', '.7z', '.gz', '.pdf')
+
+
+class _StreamBuffer():
+    """Write-only file object collecting what ZipFile writes until the generator hands it out."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def get_compress_type(file_name):
+    return zipfile.ZIP_STORED if file_name.lower().endswith(STORED_EXTENSIONS) else zipfile.ZIP_DEFLATED
+
+
+def iter_zip_directory(full_path, block_size=READ_BLOCK_SIZE):
+    """
+    Yields the bytes of a ZIP archive of the directory full_path, member paths relative to it.
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        for root, dirs, files in os.walk(full_path):
+            dirs.sort()
+            for file in sorted(files):
+                file_path = os.path.join(root, file)
+                # Calculate the relative path to be used inside the zip archive
+                arcname = os.path.relpath(file_path, start=full_path)
+                try:
+                    # Records the size, so ZIP64 is used for members that need it
+                    zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+                    src = open(file_path, 'rb')
+                except OSError as e:
+                    # Removed or unreadable since the walk listed it
+                    logger.warning(f"Skipping {file_path} in the download of {full_path}: {e}")
+                    continue
+                zinfo.compress_type = get_compress_type(file)
+                with src, zf.open(zinfo, 'w') as dest:
+                    while True:
+                        block = src.read(block_size)
+                        if not block:
+                            break
+                        dest.write(block)
+                        data = buffer.pop()
+                        if data:
+                            yield data
+                yield buffer.pop()
+    # Central directory
+    yield buffer.pop()
+
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def get_etag(stat):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def parse_range(header, size):
+    """
+    Returns the (start, end) byte positions (inclusive) of a single range header, None to send the whole file
+    (no header, several ranges or an invalid one, which RFC 9110 says to ignore), or False if the range
+    cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        # Last byte before the first: invalid rather than unsatisfiable
+        return None
+    if start >= size:
+        return False
+    end = min(int(last), size - 1) if last else size - 1
+    return start, end
+
+
+def is_range_current(if_range, etag, stat):
+    # If-Range holds either the validator of the copy the client already has, or its date
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == int(stat.st_mtime)
+
+
+def iter_file_range(path, start, end, block_size=READ_BLOCK_SIZE):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            block = f.read(min(block_size, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+
+def serve_file(request, path, download_filename):
+    """
+    Returns the response downloading the file at path (already validated by the caller) as download_filename.
+    """
+    stat = os.stat(path)
+    etag = get_etag(stat)
+
+    # 304 Not Modified / 412 Precondition Failed
+    conditional = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if conditional is not None:
+        return conditional
+
+    if settings.DOWNLOAD_OFFLOAD_HEADER:
+        # The front-end server sends the file (and handles Range itself)
+        response = HttpResponse(content_type="application/octet-stream")
+        # nginx expects a URI, X-Sendfile a filesystem path
+        location = quote(path) if settings.DOWNLOAD_OFFLOAD_HEADER.lower() == "x-accel-redirect" else path
+        response[settings.DOWNLOAD_OFFLOAD_HEADER] = settings.DOWNLOAD_OFFLOAD_PREFIX + location
+    else:
+        byte_range = None
+        if is_range_current(request.headers.get("If-Range"), etag, stat):
+            byte_range = parse_range(request.headers.get("Range"), stat.st_size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{stat.st_size}"
+            return response
+        if byte_range is None:
+            response = FileResponse(open(path, 'rb'), content_type="application/octet-stream")
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(iter_file_range(path, start, end), status=206, content_type="application/octet-stream")
+            response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+            response["Content-Length"] = str(end - start + 1)
+        response["Accept-Ranges"] = "bytes"
+
+    response["Content-Disposition"] = content_disposition_header(True, download_filename)
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(stat.st_mtime)
+    return response
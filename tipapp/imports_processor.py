@@ -1,14 +1,108 @@
 # Third-Party
 import os
+import time
 import logging
 import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 # Local
 from tipapp import settings
-from thermalimageprocessing.thermal_image_processing import unzip_and_prepare, run_thermal_processing
+# Sets up Django when imported, so it must come before the models (spawned workers import this module first)
+from thermalimageprocessing import thermal_image_processing
+from thermalimageprocessing.thermal_image_processing import unzip_and_prepare, prepare_archive, run_thermal_processing
+from tipapp import jobs
+from tipapp import dir_sizes
 
 logger = logging.getLogger(__name__)
 
+
+class ImportResult():
+
+    def __init__(self, filename, success, seconds, error=None):
+        self.filename = filename
+        self.success = success
+        self.seconds = seconds
+        self.error = error
+
+
+def init_import_worker(warp_slots):
+    # Runs once in each worker process
+    thermal_image_processing.set_warp_slots(warp_slots)
+
+
+def process_import(file_path):
+    """
+    Prepares and processes one pending archive. Everything logged meanwhile, by any module,
+    also goes to logs/imports/<archive name>.txt. Returns an ImportResult.
+    """
+    filename = os.path.basename(file_path)
+    start = time.monotonic()
+
+    logs_folder = os.path.join(settings.BASE_DIR, 'logs', 'imports')
+    os.makedirs(logs_folder, exist_ok=True)
+    file_handler = logging.FileHandler(os.path.join(logs_folder, filename + '.txt'))
+    file_handler.setLevel(logging.INFO)
+    file_handler.setFormatter(logging.Formatter("%(levelname)s %(asctime)s %(process)d %(name)s [Line:%(lineno)s][%(funcName)s] %(message)s"))
+    root_logger = logging.getLogger()
+    root_logger.addHandler(file_handler)
+
+    # log watch
+    print(f"\nProcessing file: {filename}")
+    logger.info ("File to be processed: " + str(file_path))
+
+    try:
+        # =========================================================
+        # Call Python functions directly instead of .sh
+        # =========================================================
+        logger.info(f"Starting direct Python processing for: {filename}")
+        source_root = None
+        if settings.INGEST_MODE == "archive":
+            # 1. Move and read the inputs straight from the archive (no extraction)
+            print(f"  -> [{filename}] Starting file preparation (move, read from archive)...")
+            processed_dir_path, source_root = prepare_archive(file_path)
+            print(f"  -> [{filename}] Outputs will be written to: {processed_dir_path}")
+            logger.info(f"Prepared at: {processed_dir_path}, reading inputs from: {source_root or processed_dir_path}")
+        else:
+            print(f"  -> [{filename}] Starting file preparation (unzip and move)...")
+            # 1. Unzip and Prepare (Replaces shell script logic)
+            # file_path: The full path to the pending .7z file
+            processed_dir_path = unzip_and_prepare(file_path)
+
+            print(f"  -> [{filename}] File successfully unzipped to: {processed_dir_path}")
+            logger.info(f"Unzipped and prepared at: {processed_dir_path}")
+
+        # 2. Run Main Thermal Processing
+        # This runs the GDAL/PostGIS/GeoServer pipeline
+        # Outputs are about to be written into the flight folder: its cached size is out of date until refreshed below
+        dir_sizes.mark_stale(processed_dir_path)
+        print(f"  -> [{filename}] Starting main thermal processing pipeline...")
+        success = run_thermal_processing(processed_dir_path, source_root)
+        try:
+            # Full walk of the flight folder (outputs such as output.gpkg grow in place)
+            dir_sizes.refresh_dir_size(processed_dir_path)
+        except Exception as e:
+            logger.warning(f"Could not refresh the size of {processed_dir_path}: {e}")
+
+        if success:
+            logger.info(f"Successfully finished processing for: {filename}")
+            print(f"  => SUCCESS: Finished processing {filename}")
+            return ImportResult(filename, True, time.monotonic() - start)
+        logger.error(f"Thermal processing pipeline failed for: {filename}")
+        print(f"  => ERROR: Thermal processing pipeline failed for {filename} (see the flight log)")
+        return ImportResult(filename, False, time.monotonic() - start, "Thermal processing pipeline failed.")
+
+    # Since we are running python code directly, we catch standard Exceptions
+    except Exception as e:
+        print(f"  => ERROR: An error occurred while processing {filename}: {e}")
+        logger.error(f"Error processing file {filename}: {e}", exc_info=True)
+        return ImportResult(filename, False, time.monotonic() - start, str(e))
+    finally:
+        root_logger.removeHandler(file_handler)
+        file_handler.close()
+
+
 class ImportsProcessor():
 
     def __init__(self, source_path, dest_path):
@@ -22,11 +116,13 @@ class ImportsProcessor():
         try:
             # --- Get a list of files to process first for better feedback ---
             # We check for files ending with .7z or .zip, case-insensitively.
+            # Archives modified recently may still be being uploaded: they are left for the next run
+            now = time.time()
             files_to_process = [
-                entry for entry in os.scandir(self.source_path) 
-                if entry.is_file() and entry.name.lower().endswith(('.7z', '.zip'))
+                entry for entry in os.scandir(self.source_path)
+                if entry.is_file() and entry.name.lower().endswith(('.7z', '.zip')) and jobs.is_settled(entry, now)
             ]
-            
+
             if not files_to_process:
                 print("\nNo new .7z or .zip files found in the import directory. Nothing to do.")
                 logger.info("No new files found to process.")
@@ -35,46 +131,128 @@ class ImportsProcessor():
             print(f"\nFound {len(files_to_process)} file(s) to process.")
             print("-" * 50) # A separator for readability
 
-            for entry in files_to_process:
-                filename = entry.name
-
-                # log watch
-                print(f"\nProcessing file: {filename}")
-                logger.info ("File to be processed: " + str(entry.path))   
-
-                try:
-                    # =========================================================
-                    # Call Python functions directly instead of .sh
-                    # =========================================================
-                    print(f"  -> Starting file preparation (unzip and move)...")
-                    logger.info(f"Starting direct Python processing for: {filename}")
-                    
-                    # 1. Unzip and Prepare (Replaces shell script logic)
-                    # entry.path: The full path to the pending .7z file
-                    # dest_path: Where to move the original .7z file after extraction
-                    processed_dir_path = unzip_and_prepare(entry.path)
-                    
-                    print(f"  -> File successfully unzipped to: {processed_dir_path}")
-                    logger.info(f"Unzipped and prepared at: {processed_dir_path}")
-                    
-                    # 2. Run Main Thermal Processing
-                    # This runs the GDAL/PostGIS/GeoServer pipeline
-                    print(f"  -> Starting main thermal processing pipeline...")
-                    run_thermal_processing(processed_dir_path)
-                    
-                    print(f"  -> Thermal processing pipeline completed successfully.")
-                    logger.info(f"Successfully finished processing for: {filename}")
-                    
-                    print(f"  => SUCCESS: Finished processing {filename}")
-
-                # Since we are running python code directly, we catch standard Exceptions
-                except Exception as e:
-                    print(f"  => ERROR: An error occurred while processing {filename}: {e}")
-                    logger.error(f"Error processing file {filename}: {e}", exc_info=True)
+            start = time.monotonic()
+            # Leases keep an overlapping run (next cron tick, web trigger, import worker) off the archives we process
+            self.lease_owner = jobs.get_lease_owner()
+            with jobs.LeaseKeeper(self.lease_owner):
+                if settings.IMPORT_MAX_CONCURRENT_FLIGHTS > 1 and len(files_to_process) > 1:
+                    results = self.process_concurrently(files_to_process)
+                else:
+                    results = []
+                    for entry in files_to_process:
+                        job = self.acquire(entry)
+                        if job is not None:
+                            result = process_import(entry.path)
+                            jobs.finish_job(job, result.success, result.error, self.lease_owner)
+                            results.append(result)
 
             print("-" * 50)
             print("All pending files have been processed.")
+            self.print_summary(results, time.monotonic() - start)
 
         except Exception as e:
             print(f"\nA critical error occurred: {e}")
             logger.error(f"A critical error occurred in ImportsProcessor: {e}", exc_info=True)
+
+    def acquire(self, entry):
+        """
+        Takes the lease on an archive's job. Returns the job, or None if the archive is being processed elsewhere.
+        """
+        job = jobs.acquire_lease(entry.name, self.lease_owner)
+        if job is None:
+            print(f"\nSkipping {entry.name}: already being processed by another run.")
+            logger.info(f"Skipping {entry.name}: already being processed by another run.")
+            return None
+        if not os.path.exists(entry.path):
+            # Finished by the other run between our scan and the claim
+            jobs.finish_job(job, False, "Archive no longer in the pending imports folder.", self.lease_owner)
+            return None
+        return job
+
+    def process_concurrently(self, entries):
+        """
+        Processes the archives in a pool of IMPORT_MAX_CONCURRENT_FLIGHTS worker processes, each flight in its own worker.
+        At most MAX_CONCURRENT_WARPS mosaics are warped at once across the workers, and a new flight is only
+        started if the total size of the archives in progress stays under IMPORT_MAX_DISK_IN_FLIGHT_GB
+        (a flight always starts when nothing else is running).
+        """
+        max_flights = settings.IMPORT_MAX_CONCURRENT_FLIGHTS
+        disk_limit = settings.IMPORT_MAX_DISK_IN_FLIGHT_GB * 1024 ** 3
+        print(f"Processing up to {max_flights} flights concurrently.")
+        logger.info(f"Processing {len(entries)} archive(s) with up to {max_flights} concurrent flights.")
+
+        # Spawned workers: GDAL and the pipeline's own thread pools do not survive a fork safely
+        context = multiprocessing.get_context("spawn")
+        warp_slots = context.BoundedSemaphore(max(1, settings.MAX_CONCURRENT_WARPS))
+
+        pending = [(entry, entry.stat().st_size) for entry in entries]
+        running = {}
+        in_flight = 0
+        results = []
+        executor = ProcessPoolExecutor(max_workers=max_flights, mp_context=context, initializer=init_import_worker, initargs=(warp_slots,))
+        try:
+            while pending or running:
+                broken = False
+                while pending and len(running) < max_flights:
+                    entry, size = pending[0]
+                    if running and disk_limit > 0 and in_flight + size > disk_limit:
+                        break
+                    pending.pop(0)
+                    job = self.acquire(entry)
+                    if job is None:
+                        continue
+                    try:
+                        future = executor.submit(process_import, entry.path)
+                    except BrokenProcessPool as e:
+                        broken = True
+                        logger.error(f"Could not start {entry.name}: {e}")
+                        jobs.finish_job(job, False, "Worker pool failed.", self.lease_owner)
+                        results.append(ImportResult(entry.name, False, 0, "Worker pool failed."))
+                        break
+                    running[future] = (job, entry.name, size)
+                    in_flight += size
+
+                if running and not broken:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        job, name, size = running.pop(future)
+                        in_flight -= size
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            # The worker itself died (e.g. killed for using too much memory), which breaks the pool
+                            broken = broken or isinstance(e, BrokenProcessPool)
+                            logger.error(f"Worker processing {name} failed: {e}", exc_info=True)
+                            result = ImportResult(name, False, 0, f"Worker failed: {e}")
+                        jobs.finish_job(job, result.success, result.error, self.lease_owner)
+                        results.append(result)
+
+                if broken:
+                    # A dead worker breaks the whole pool: fail the other running flights and carry on with the
+                    # pending ones in a new pool
+                    for job, name, size in running.values():
+                        jobs.finish_job(job, False, "Worker pool failed.", self.lease_owner)
+                        results.append(ImportResult(name, False, 0, "Worker pool failed."))
+                    running = {}
+                    in_flight = 0
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    executor = ProcessPoolExecutor(max_workers=max_flights, mp_context=context, initializer=init_import_worker, initargs=(warp_slots,))
+                elif not running:
+                    break
+        finally:
+            executor.shutdown(wait=True)
+        return results
+
+    def print_summary(self, results, seconds):
+        succeeded = [result for result in results if result.success]
+        failed = [result for result in results if not result.success]
+        summary = f"Summary: {len(succeeded)} succeeded, {len(failed)} failed, in {seconds / 60:.1f} minutes."
+        print(summary)
+        logger.info(summary)
+        for result in results:
+            status = "OK    " if result.success else "FAILED"
+            line = f"  {status} {result.filename} ({result.seconds / 60:.1f} min)"
+            if result.error:
+                line += f": {result.error}"
+            print(line)
+            logger.info(line)
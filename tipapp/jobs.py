@@ -0,0 +1,206 @@
+"""
+Database-backed queue of archive processing jobs.
+
+Uploads and scans of PENDING_IMPORT_PATH enqueue an ImportJob per archive, and
+the long-running import worker (import_worker_command) claims queued jobs and
+processes them, recording their status, attempts and timestamps.
+
+Every process running a job holds a lease on it. Claims are a single conditional
+UPDATE, so of two processes racing for the same archive (the worker, the cron
+command, the web trigger) exactly one wins and the others skip it immediately.
+A LeaseKeeper thread renews the process's leases; if the process dies, its
+leases expire after IMPORT_LEASE_TTL seconds and the jobs can be claimed again.
+"""
+# Third-Party
+import os
+import time
+import uuid
+import socket
+import logging
+import threading
+from datetime import timedelta
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+# Local
+from tipapp import settings
+from tipapp.models import ImportJob
+
+logger = logging.getLogger(__name__)
+
+
+def is_import_archive(filename):
+    return filename.lower().endswith(('.7z', '.zip'))
+
+
+def is_settled(entry, now=None):
+    """
+    Whether a pending archive (os.DirEntry) has not been modified for IMPORT_SCAN_SETTLE_SECONDS,
+    i.e. is not still being uploaded or copied in.
+    """
+    now = now if now is not None else time.time()
+    return now - entry.stat().st_mtime >= settings.IMPORT_SCAN_SETTLE_SECONDS
+
+
+def get_lease_owner():
+    # Unique to this process (and this run of it)
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def enqueue_import(archive_name):
+    """
+    Queues a processing job for an archive in PENDING_IMPORT_PATH, unless one is already queued or running.
+    Returns the active job.
+    """
+    try:
+        with transaction.atomic():
+            job, created = ImportJob.objects.get_or_create(
+                archive_name=archive_name,
+                status__in=ImportJob.ACTIVE_STATUSES,
+                defaults={"archive_name": archive_name, "status": ImportJob.STATUS_QUEUED},
+            )
+    except IntegrityError:
+        # Queued concurrently by another process
+        return ImportJob.objects.get(archive_name=archive_name, status__in=ImportJob.ACTIVE_STATUSES)
+    if created:
+        logger.info(f"Queued import job {job.pk} for: {archive_name}")
+    return job
+
+
+def enqueue_pending_imports(pending_path=None):
+    """
+    Queues a job for every archive in the pending imports folder that does not have one yet.
+    Archives whose job failed are left alone, so they are not retried forever, and archives modified
+    recently are left for a later scan, as they may still be being written. Returns the new jobs.
+    """
+    pending_path = pending_path or settings.PENDING_IMPORT_PATH
+    now = time.time()
+    names = [
+        entry.name for entry in os.scandir(pending_path)
+        if entry.is_file() and is_import_archive(entry.name) and is_settled(entry, now)
+    ]
+    if not names:
+        return []
+    known = set(
+        ImportJob.objects.filter(archive_name__in=names)
+        .exclude(status=ImportJob.STATUS_SUCCEEDED)
+        .values_list("archive_name", flat=True)
+    )
+    return [enqueue_import(name) for name in names if name not in known]
+
+
+def get_claimable_filter(now):
+    # Queued, or running under a lease that has expired (or was never taken)
+    return Q(status=ImportJob.STATUS_QUEUED) | Q(
+        Q(lease_expires__lt=now) | Q(lease_expires__isnull=True),
+        status=ImportJob.STATUS_RUNNING,
+    )
+
+
+def try_claim(job_id, owner):
+    """
+    Atomically claims a job for owner if it is claimable. Returns the job, or None if another process holds it.
+    """
+    now = timezone.now()
+    claimed = ImportJob.objects.filter(get_claimable_filter(now), pk=job_id).update(
+        status=ImportJob.STATUS_RUNNING,
+        attempts=F("attempts") + 1,
+        started=now,
+        finished=None,
+        error="",
+        lease_owner=owner,
+        lease_expires=now + timedelta(seconds=settings.IMPORT_LEASE_TTL),
+        heartbeat=now,
+        updated=now,
+    )
+    if not claimed:
+        return None
+    job = ImportJob.objects.get(pk=job_id)
+    logger.info(f"Claimed import job {job.pk} for: {job.archive_name} (attempt {job.attempts})")
+    return job
+
+
+def acquire_lease(archive_name, owner):
+    """
+    Claims the archive's job (queuing it first if needed). Returns the job, or None if another process is running it.
+    """
+    job = enqueue_import(archive_name)
+    return try_claim(job.pk, owner)
+
+
+def claim_next_job(owner):
+    """
+    Claims the oldest claimable job for owner and returns it, or returns None if there is none.
+    """
+    candidates = ImportJob.objects.filter(get_claimable_filter(timezone.now())).order_by("created").values_list("pk", flat=True)[:20]
+    for job_id in candidates:
+        job = try_claim(job_id, owner)
+        if job is not None:
+            return job
+    return None
+
+
+def renew_leases(owner):
+    now = timezone.now()
+    return ImportJob.objects.filter(status=ImportJob.STATUS_RUNNING, lease_owner=owner).update(
+        lease_expires=now + timedelta(seconds=settings.IMPORT_LEASE_TTL),
+        heartbeat=now,
+    )
+
+
+def finish_job(job, success, error, owner):
+    """
+    Records the outcome of a job and releases its lease. Logs a warning if the lease was lost meanwhile.
+    """
+    now = timezone.now()
+    job.status = ImportJob.STATUS_SUCCEEDED if success else ImportJob.STATUS_FAILED
+    job.error = error or ""
+    job.finished = now
+    released = ImportJob.objects.filter(pk=job.pk, lease_owner=owner).update(
+        status=job.status,
+        error=job.error,
+        finished=now,
+        lease_owner="",
+        lease_expires=None,
+        updated=now,
+    )
+    if not released:
+        logger.warning(f"Lease on import job {job.pk} ({job.archive_name}) was lost before it finished; outcome not recorded: {job.status}")
+        return
+    logger.info(f"Import job {job.pk} for {job.archive_name}: {job.status}")
+
+
+class LeaseKeeper():
+    """Renews every lease held by owner from a background thread, every third of IMPORT_LEASE_TTL."""
+
+    def __init__(self, owner):
+        self.owner = owner
+        self.interval = max(1, settings.IMPORT_LEASE_TTL / 3)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="import-lease-keeper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _run(self):
+        try:
+            while not self._stop.wait(self.interval):
+                try:
+                    renew_leases(self.owner)
+                except Exception as e:
+                    logger.error(f"Failed to renew import leases: {e}", exc_info=True)
+        finally:
+            # Django opens one connection per thread
+            connection.close()
@@ -0,0 +1,108 @@
+"""Thermal Image Processing Import Worker Management Command."""
+
+
+# Third-Party
+import os
+import time
+import signal
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from django.core.management import base
+from django.db import close_old_connections
+# Local
+from tipapp import settings
+from tipapp import jobs
+from tipapp.imports_processor import init_import_worker, process_import
+logger = logging.getLogger(__name__)
+
+
+class Command(base.BaseCommand):
+    """Long-running worker processing the queued import jobs."""
+    # Help string
+    help = "Processes queued import jobs as they arrive"  # noqa: A003
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=settings.IMPORT_MAX_CONCURRENT_FLIGHTS, help="Number of flights processed at once")
+
+    def handle(self, *args, **kwargs) -> None:
+        """Handles the management command functionality."""
+        concurrency = max(1, kwargs["concurrency"])
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        self.stdout.write(f"Import worker started (concurrency {concurrency}), watching the import job queue...")
+        logger.info(f"Import worker started with concurrency {concurrency}.")
+
+        # The worker processes are spawned once and reused for every job, so GDAL, geopandas
+        # and the pipeline modules are only imported once
+        context = multiprocessing.get_context("spawn")
+        warp_slots = context.BoundedSemaphore(max(1, settings.MAX_CONCURRENT_WARPS))
+        executor = ProcessPoolExecutor(max_workers=concurrency, mp_context=context, initializer=init_import_worker, initargs=(warp_slots,))
+        running = {}
+        next_scan = 0
+        owner = jobs.get_lease_owner()
+        lease_keeper = jobs.LeaseKeeper(owner)
+        lease_keeper.start()
+        try:
+            while not self.stopping or running:
+                close_old_connections()
+
+                # Safety net for archives that reached the pending folder without being queued
+                if not self.stopping and time.monotonic() >= next_scan:
+                    try:
+                        jobs.enqueue_pending_imports()
+                    except Exception as e:
+                        logger.error(f"Failed to scan the pending imports folder: {e}", exc_info=True)
+                    next_scan = time.monotonic() + settings.IMPORT_WORKER_SCAN_INTERVAL
+
+                while not self.stopping and len(running) < concurrency:
+                    job = jobs.claim_next_job(owner)
+                    if job is None:
+                        break
+                    archive_path = os.path.join(settings.PENDING_IMPORT_PATH, job.archive_name)
+                    if not os.path.exists(archive_path):
+                        jobs.finish_job(job, False, "Archive no longer in the pending imports folder.", owner)
+                        continue
+                    self.stdout.write(f"Processing import job {job.pk}: {job.archive_name}")
+                    running[executor.submit(process_import, archive_path)] = job
+
+                if not running:
+                    time.sleep(settings.IMPORT_WORKER_POLL_INTERVAL)
+                    continue
+
+                done, _ = wait(running, timeout=settings.IMPORT_WORKER_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    job = running.pop(future)
+                    try:
+                        result = future.result()
+                        jobs.finish_job(job, result.success, result.error, owner)
+                    except BrokenProcessPool as e:
+                        broken = True
+                        logger.error(f"Worker processing import job {job.pk} died: {e}", exc_info=True)
+                        jobs.finish_job(job, False, f"Worker failed: {e}", owner)
+                    except Exception as e:
+                        logger.error(f"Import job {job.pk} failed: {e}", exc_info=True)
+                        jobs.finish_job(job, False, str(e), owner)
+                    self.stdout.write(f"Import job {job.pk} {job.status}: {job.archive_name}")
+
+                if broken:
+                    # A dead worker breaks the whole pool: fail the other running jobs and start a new pool
+                    for future, job in running.items():
+                        jobs.finish_job(job, False, "Worker pool failed.", owner)
+                    running = {}
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    executor = ProcessPoolExecutor(max_workers=concurrency, mp_context=context, initializer=init_import_worker, initargs=(warp_slots,))
+        finally:
+            executor.shutdown(wait=True)
+            lease_keeper.stop()
+            self.stdout.write("Import worker stopped.")
+            logger.info("Import worker stopped.")
+
+    def stop(self, signum, frame):
+        # Finish the running jobs, but do not claim new ones
+        logger.info(f"Import worker received signal {signum}, stopping after the running jobs.")
+        self.stopping = True
@@ -0,0 +1,35 @@
+"""Thermal Image Processing Mosaic Materialisation Management Command."""
+
+
+# Third-Party
+import os
+import logging
+from django.core.management import base
+# Local
+from tipapp import settings
+from thermalimageprocessing.thermal_image_processing import materialise_and_publish_mosaic
+logger = logging.getLogger(__name__)
+
+
+class Command(base.BaseCommand):
+    """Materialise Virtual Mosaic Command."""
+    # Help string
+    help = "Materialises a flight's virtual mosaic (VRT), then copies it to GeoServer storage and publishes it"  # noqa: A003
+
+    def add_arguments(self, parser: base.CommandParser) -> None:
+        """Adds the flight argument to the management command."""
+        parser.add_argument(
+            "flight",
+            type=str,
+            help="Flight folder name within DATA_STORAGE, or the full path to the flight folder",
+        )
+
+    def handle(self, *args, **kwargs) -> None:
+        """Handles the management command functionality."""
+        flight = kwargs["flight"]
+        flight_path = flight if os.path.isabs(flight) else os.path.join(settings.DATA_STORAGE, flight)
+
+        # Display information
+        self.stdout.write(f"Materialising virtual mosaic for: {flight_path}")
+        materialise_and_publish_mosaic(flight_path)
+        self.stdout.write("Mosaic materialised and published.")
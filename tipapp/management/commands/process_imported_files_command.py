@@ -9,6 +9,7 @@ from django.core.management import base
 from datetime import datetime
 # Local
 from tipapp import settings
+from tipapp import jobs
 from tipapp.imports_processor import ImportsProcessor
 logger = logging.getLogger(__name__)
 
@@ -20,6 +21,11 @@ class Command(base.BaseCommand):
 
     def handle(self, *args, **kwargs) -> None:
         """Handles the management command functionality."""
+        if settings.IMPORT_QUEUE_ENABLED:
+            # The import worker processes the archives, just make sure they are all queued
+            queued = jobs.enqueue_pending_imports()
+            self.stdout.write(f"Queued {len(queued)} imported file(s) for the import worker.")
+            return
         # Display information
         self.stdout.write("Processing imported files...")
         ImportsProcessor(settings.PENDING_IMPORT_PATH, settings.UPLOADS_HISTORY_PATH).process_files()
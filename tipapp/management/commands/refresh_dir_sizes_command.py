@@ -0,0 +1,20 @@
+"""Thermal Image Processing Directory Sizes Refresh Management Command."""
+
+
+# Third-Party
+from django.core.management import base
+# Local
+from tipapp import settings
+from tipapp import dir_sizes
+
+
+class Command(base.BaseCommand):
+    """Refreshes the cached directory sizes shown by the file browser."""
+    # Help string
+    help = "Refreshes the missing or stale cached sizes of the thermal data folders"  # noqa: A003
+
+    def handle(self, *args, **kwargs) -> None:
+        """Handles the management command functionality."""
+        for base_path in [settings.DATA_STORAGE, settings.UPLOADS_HISTORY_PATH]:
+            refreshed = dir_sizes.refresh_stale_dir_sizes(base_path)
+            self.stdout.write(f"Refreshed the size of {len(refreshed)} folder(s) in {base_path}.")
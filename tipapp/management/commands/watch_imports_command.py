@@ -0,0 +1,153 @@
+"""Thermal Image Processing Pending Imports Watcher Management Command."""
+
+
+# Third-Party
+import os
+import time
+import signal
+import logging
+import multiprocessing
+import pyinotify
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from django.core.management import base
+from django.db import close_old_connections
+# Local
+from tipapp import settings
+from tipapp import jobs
+from tipapp.imports_processor import ImportResult, init_import_worker, process_import
+logger = logging.getLogger(__name__)
+
+
+class PendingImportsHandler(pyinotify.ProcessEvent):
+    """Records the archives written or moved into the watched folder."""
+
+    def my_init(self, candidates):
+        self.candidates = candidates
+
+    def add(self, event):
+        if not event.dir and jobs.is_import_archive(event.name) and not event.name.startswith("."):
+            logger.info(f"Archive arrived: {event.pathname} ({event.maskname})")
+            # Size and time it was last seen changing
+            self.candidates.setdefault(event.pathname, (None, time.monotonic()))
+
+    def process_IN_CLOSE_WRITE(self, event):
+        self.add(event)
+
+    def process_IN_MOVED_TO(self, event):
+        self.add(event)
+
+
+class Command(base.BaseCommand):
+    """Watches the pending imports folder and hands each archive to the pipeline as soon as it is complete."""
+    # Help string
+    help = "Watches the pending imports folder and processes archives as they arrive"  # noqa: A003
+
+    def handle(self, *args, **kwargs) -> None:
+        """Handles the management command functionality."""
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        watch_path = str(settings.PENDING_IMPORT_PATH)
+        candidates = {}
+        watch_manager = pyinotify.WatchManager()
+        notifier = pyinotify.Notifier(watch_manager, PendingImportsHandler(candidates=candidates), timeout=1000)
+        watch_manager.add_watch(watch_path, pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO)
+
+        # Archives that arrived while the watcher was not running
+        for entry in os.scandir(watch_path):
+            if entry.is_file() and jobs.is_import_archive(entry.name) and not entry.name.startswith("."):
+                candidates[entry.path] = (None, time.monotonic())
+
+        self.stdout.write(f"Watching {watch_path} for new archives...")
+        logger.info(f"Watching {watch_path} for new archives.")
+
+        self.owner = jobs.get_lease_owner()
+        self.running = {}
+        self.executor = None
+        lease_keeper = jobs.LeaseKeeper(self.owner)
+        lease_keeper.start()
+        try:
+            while not self.stopping or self.running:
+                if notifier.check_events():
+                    notifier.read_events()
+                    notifier.process_events()
+                if not self.stopping:
+                    for path in self.get_settled(candidates):
+                        self.hand_off(path)
+                self.collect_finished()
+        finally:
+            notifier.stop()
+            if self.executor is not None:
+                self.executor.shutdown(wait=True)
+            lease_keeper.stop()
+            self.stdout.write("Watcher stopped.")
+            logger.info("Watcher stopped.")
+
+    def get_settled(self, candidates):
+        """
+        Returns (and forgets) the candidate archives whose size has not changed for IMPORT_WATCH_SETTLE_SECONDS.
+        """
+        settled = []
+        now = time.monotonic()
+        for path, (last_size, last_change) in list(candidates.items()):
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                # Moved away or deleted in the meantime
+                del candidates[path]
+                continue
+            if size != last_size:
+                candidates[path] = (size, now)
+            elif now - last_change >= settings.IMPORT_WATCH_SETTLE_SECONDS:
+                del candidates[path]
+                settled.append(path)
+        return settled
+
+    def hand_off(self, path):
+        close_old_connections()
+        name = os.path.basename(path)
+        if settings.IMPORT_QUEUE_ENABLED:
+            # The import worker picks it up within seconds
+            job = jobs.enqueue_import(name)
+            self.stdout.write(f"Queued {name} (job {job.pk}).")
+            return
+
+        job = jobs.acquire_lease(name, self.owner)
+        if job is None:
+            logger.info(f"Skipping {name}: already being processed by another run.")
+            return
+        if self.executor is None:
+            # Spawned once and reused, so the pipeline modules are only imported once
+            context = multiprocessing.get_context("spawn")
+            warp_slots = context.BoundedSemaphore(max(1, settings.MAX_CONCURRENT_WARPS))
+            self.executor = ProcessPoolExecutor(
+                max_workers=max(1, settings.IMPORT_MAX_CONCURRENT_FLIGHTS),
+                mp_context=context,
+                initializer=init_import_worker,
+                initargs=(warp_slots,),
+            )
+        self.stdout.write(f"Processing {name} (job {job.pk}).")
+        self.running[self.executor.submit(process_import, path)] = job
+
+    def collect_finished(self):
+        for future in [future for future in self.running if future.done()]:
+            job = self.running.pop(future)
+            close_old_connections()
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"Worker processing {job.archive_name} failed: {e}", exc_info=True)
+                result = ImportResult(job.archive_name, False, 0, f"Worker failed: {e}")
+                if isinstance(e, BrokenProcessPool) and self.executor is not None:
+                    # A dead worker breaks the whole pool (its other imports fail too): start a new one on the next hand off
+                    self.executor.shutdown(wait=False, cancel_futures=True)
+                    self.executor = None
+            jobs.finish_job(job, result.success, result.error, self.owner)
+            self.stdout.write(f"{job.archive_name}: {job.status}.")
+
+    def stop(self, signum, frame):
+        # Finish the running imports, but do not start new ones
+        logger.info(f"Watcher received signal {signum}, stopping after the running imports.")
+        self.stopping = True
@@ -0,0 +1,48 @@
+"""Thermal Image Processing Django Application Models."""
+
+
+# Third-Party
+from django.db import models
+
+
+class ImportJob(models.Model):
+    """Processing job for an archive uploaded to the pending imports folder."""
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_SUCCEEDED = "succeeded"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, "Queued"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_SUCCEEDED, "Succeeded"),
+        (STATUS_FAILED, "Failed"),
+    ]
+    ACTIVE_STATUSES = [STATUS_QUEUED, STATUS_RUNNING]
+
+    # File name of the archive in PENDING_IMPORT_PATH
+    archive_name = models.CharField(max_length=255)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    updated = models.DateTimeField(auto_now=True)
+    # Lease of the process running the job: renewed by its heartbeat, reclaimable by others once expired
+    lease_owner = models.CharField(max_length=255, blank=True, default="")
+    lease_expires = models.DateTimeField(null=True, blank=True, db_index=True)
+    heartbeat = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["created"]
+        constraints = [
+            # At most one queued or running job per archive
+            models.UniqueConstraint(
+                fields=["archive_name"],
+                condition=models.Q(status__in=["queued", "running"]),
+                name="unique_active_import_job",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.archive_name} ({self.status})"
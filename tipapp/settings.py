@@ -320,6 +320,98 @@ DATA_STORAGE = decouple.config("DATA_STORAGE", default=os.path.join(BASE_DIR, DA
 DOWNLOADS_PATH = decouple.config("DOWNLOADS_PATH", default=os.path.join(BASE_DIR, DOWNLOADS_FOLDER_NAME))
 UPLOADS_HISTORY_PATH = decouple.config("UPLOADS_HISTORY_PATH", default=os.path.join(BASE_DIR, UPLOADS_HISTORY_FOLDER_NAME))
 
-for dir_path in [PENDING_IMPORT_PATH, DATA_STORAGE, DOWNLOADS_PATH, UPLOADS_HISTORY_PATH]:
+# Resumable chunked uploads (see tipapp/uploads.py). Keep CHUNKED_UPLOADS_PATH on the same filesystem as
+# PENDING_IMPORT_PATH so completed uploads are moved in with a rename rather than a copy.
+CHUNKED_UPLOADS_PATH = decouple.config("CHUNKED_UPLOADS_PATH", default=os.path.join(PENDING_IMPORT_PATH, ".chunked_uploads"))
+CHUNKED_UPLOAD_CHUNK_SIZE = decouple.config("CHUNKED_UPLOAD_CHUNK_SIZE", default=16 * 1024 * 1024, cast=int)  # Bytes per chunk
+CHUNKED_UPLOAD_EXPIRY_HOURS = decouple.config("CHUNKED_UPLOAD_EXPIRY_HOURS", default=48, cast=float)  # Unfinished uploads are removed after this
+
+# Seconds after which a cached directory size in the file browser is shown as approximate and refreshed by
+# refresh_dir_sizes_command, even if the directory looks unchanged
+DIR_SIZE_CACHE_MAX_AGE = decouple.config("DIR_SIZE_CACHE_MAX_AGE", default=3600, cast=int)
+# Single-file downloads can be sent by the front-end server once the view has checked the path:
+# "X-Accel-Redirect" (nginx) or "X-Sendfile" (Apache mod_xsendfile, lighttpd); empty to send them from Django.
+# DOWNLOAD_OFFLOAD_PREFIX is prepended to the file's absolute path, e.g. "/protected-downloads" with
+# nginx "location /protected-downloads/ { internal; alias /; }".
+DOWNLOAD_OFFLOAD_HEADER = decouple.config("DOWNLOAD_OFFLOAD_HEADER", default="")
+DOWNLOAD_OFFLOAD_PREFIX = decouple.config("DOWNLOAD_OFFLOAD_PREFIX", default="")
+
+for dir_path in [PENDING_IMPORT_PATH, DATA_STORAGE, DOWNLOADS_PATH, UPLOADS_HISTORY_PATH, CHUNKED_UPLOADS_PATH]:
     if not os.path.exists(dir_path):
-        os.makedirs(dir_path)
\ No newline at end of file
+        os.makedirs(dir_path)
+
+# Ingestion of uploaded archives
+# "extract" : the archive is moved to UPLOADS_HISTORY_PATH and extracted from there into DATA_STORAGE before
+#             processing (every member, or only the ones the pipeline reads, per ARCHIVE_EXTRACTION).
+# "archive" : the archive is moved to UPLOADS_HISTORY_PATH and the inputs are read in place through /vsizip/ or /vsi7z/
+#             (GDAL >= 3.7); only the outputs are written to DATA_STORAGE. Best with .zip or non-solid .7z archives,
+#             as reading a member of a solid 7z block means decompressing the block up to it.
+INGEST_MODE = decouple.config("INGEST_MODE", default="extract")
+# "full"      : extract every member of the archive with 7z.
+# "selective" : extract only the members the pipeline reads (archive.REQUIRED_MEMBERS: the PNGs/CAMERA1 images with
+#               their world files and .aux.xml sidecars, and KML Boundaries/CAMERA1/*bnd.kml).
+ARCHIVE_EXTRACTION = decouple.config("ARCHIVE_EXTRACTION", default="full")
+ARCHIVE_EXTRACTION_WORKERS = decouple.config("ARCHIVE_EXTRACTION_WORKERS", default=4, cast=int)  # Threads extracting zip members
+# Concurrent processing of pending archives (1 processes them one after another)
+IMPORT_MAX_CONCURRENT_FLIGHTS = decouple.config("IMPORT_MAX_CONCURRENT_FLIGHTS", default=1, cast=int)
+# Maximum number of mosaics warped at once across the concurrent flights
+MAX_CONCURRENT_WARPS = decouple.config("MAX_CONCURRENT_WARPS", default=1, cast=int)
+# Maximum total size (GB) of the archives processed at once, as a proxy for the disk they need (0 for no limit)
+IMPORT_MAX_DISK_IN_FLIGHT_GB = decouple.config("IMPORT_MAX_DISK_IN_FLIGHT_GB", default=0, cast=float)
+# Job queue: uploads and scans queue ImportJobs, processed by the long-running import_worker_command
+# (process_imported_files_command then only queues the pending archives)
+IMPORT_QUEUE_ENABLED = decouple.config("IMPORT_QUEUE_ENABLED", default=False, cast=bool)
+IMPORT_WORKER_POLL_INTERVAL = decouple.config("IMPORT_WORKER_POLL_INTERVAL", default=2, cast=float)  # Seconds between queue polls when idle
+IMPORT_WORKER_SCAN_INTERVAL = decouple.config("IMPORT_WORKER_SCAN_INTERVAL", default=60, cast=float)  # Seconds between scans of the pending imports folder
+# Seconds a processing lease on an archive lasts without a heartbeat (renewed every third of it) before another run may reclaim it
+IMPORT_LEASE_TTL = decouple.config("IMPORT_LEASE_TTL", default=300, cast=int)
+# Seconds an archive must have gone unmodified before a scan of the pending imports folder (cron, import worker) picks it up
+IMPORT_SCAN_SETTLE_SECONDS = decouple.config("IMPORT_SCAN_SETTLE_SECONDS", default=60, cast=float)
+# Seconds an archive's size must stay unchanged before watch_imports_command hands it to the pipeline
+IMPORT_WATCH_SETTLE_SECONDS = decouple.config("IMPORT_WATCH_SETTLE_SECONDS", default=5, cast=float)
+
+# Mosaic creation (Step 1 of the thermal processing pipeline)
+# "warp"  : every PNG of the flight is merged in a single gdal.Warp call.
+# "tiled" : the output extent is split into tiles which are warped in a process pool and stitched together.
+# "vrt"   : a VRT is built over the PNGs and materialised into the mosaic image later (see MOSAIC_VRT_MATERIALISE).
+MOSAIC_MODE = decouple.config("MOSAIC_MODE", default="warp")
+MOSAIC_WORKERS = decouple.config("MOSAIC_WORKERS", default=os.cpu_count() or 1, cast=int)
+MOSAIC_TILE_SIZE = decouple.config("MOSAIC_TILE_SIZE", default=4096, cast=int)  # Tile width/height in pixels
+# Keep a manifest of input hashes next to the mosaic and only re-warp tiles touched by changed images on rebuilds (uses the tiled engine)
+MOSAIC_INCREMENTAL = decouple.config("MOSAIC_INCREMENTAL", default=False, cast=bool)
+# Mosaic output profile
+# "gtiff" : striped DEFLATE GeoTIFF, SRS stamped afterwards with gdal_edit.
+# "cog"   : Cloud-Optimized GeoTIFF (tiled, compressed, internal overviews) with the SRS set at warp time.
+MOSAIC_OUTPUT_PROFILE = decouple.config("MOSAIC_OUTPUT_PROFILE", default="gtiff")
+MOSAIC_COG_BLOCKSIZE = decouple.config("MOSAIC_COG_BLOCKSIZE", default=512, cast=int)
+MOSAIC_COG_OVERVIEW_RESAMPLING = decouple.config("MOSAIC_COG_OVERVIEW_RESAMPLING", default="")  # Empty uses the COG driver default
+# Virtual mosaic (MOSAIC_MODE=vrt)
+# "background" : the VRT is materialised into the mosaic image while the rest of the pipeline runs.
+# "on_demand"  : the VRT is only materialised when requested with the materialise_mosaic_command.
+MOSAIC_VRT_MATERIALISE = decouple.config("MOSAIC_VRT_MATERIALISE", default="background")
+# Number of threads used to read the image headers for the flight-level raster index
+RASTER_INDEX_WORKERS = decouple.config("RASTER_INDEX_WORKERS", default=8, cast=int)
+# Maximum number of independent pipeline steps run concurrently for a flight (1 runs the steps one after another)
+PIPELINE_MAX_WORKERS = decouple.config("PIPELINE_MAX_WORKERS", default=4, cast=int)
+# Number of hotspot images converted from PNG to TIF (and copied to GeoServer storage) in parallel
+HOTSPOT_CONVERSION_WORKERS = decouple.config("HOTSPOT_CONVERSION_WORKERS", default=os.cpu_count() or 1, cast=int)
+# "local"  : write each hotspot TIF next to its PNG, then copy it to GeoServer storage.
+# "direct" : translate in memory (/vsimem/) and write each TIF once, straight to GeoServer storage.
+HOTSPOT_TIF_OUTPUT_MODE = decouple.config("HOTSPOT_TIF_OUTPUT_MODE", default="local")
+HOTSPOT_TIF_KEEP_LOCAL = decouple.config("HOTSPOT_TIF_KEEP_LOCAL", default=False, cast=bool)  # In "direct" mode, also keep a copy next to the PNG
+
+# GeoServer storage (rclone mount the mosaics and hotspot images are copied to)
+GEOSERVER_STORAGE_PATH = decouple.config("GEOSERVER_STORAGE_PATH", default="/rclone-mounts/thermalimaging-flightmosaics")
+# Maximum number of seconds to wait for copied files to be visible on the mount before publishing
+STORAGE_SYNC_TIMEOUT = decouple.config("STORAGE_SYNC_TIMEOUT", default=300, cast=int)
+# Also compare checksums (not just sizes) of the copied files before publishing
+STORAGE_SYNC_VERIFY_CHECKSUM = decouple.config("STORAGE_SYNC_VERIFY_CHECKSUM", default=False, cast=bool)
+STORAGE_COPY_VERIFY_CHECKSUM = decouple.config("STORAGE_COPY_VERIFY_CHECKSUM", default=False, cast=bool)  # Verify the SHA-256 of each copy before renaming it into place
+
+# GeoServer publishing
+GEOSERVER_PUBLISH_WORKERS = decouple.config("GEOSERVER_PUBLISH_WORKERS", default=8, cast=int)  # Concurrent REST requests (and pooled connections)
+GEOSERVER_CONNECT_TIMEOUT = decouple.config("GEOSERVER_CONNECT_TIMEOUT", default=10, cast=float)  # Seconds
+GEOSERVER_READ_TIMEOUT = decouple.config("GEOSERVER_READ_TIMEOUT", default=120, cast=float)  # Seconds
+# "coverages"   : one coverage store and layer per hotspot image.
+# "imagemosaic" : one ImageMosaic store and layer per flight over its images directory, with the image name as an attribute.
+GEOSERVER_HOTSPOT_PUBLISH_MODE = decouple.config("GEOSERVER_HOTSPOT_PUBLISH_MODE", default="coverages")
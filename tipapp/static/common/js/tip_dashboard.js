@@ -166,6 +166,14 @@ var tip_dashboard = {
           title: "Size",
           data: "size",
           render: function (data, type, row) {
+            if (row.size_approximate) {
+              // Cached size being refreshed on the server
+              return utils.markup(
+                "span",
+                "~" + utils.formatFileSize(data ?? 0),
+                { title: "Approximate, refreshing", class: "text-muted" }
+              );
+            }
             return utils.markup("span", utils.formatFileSize(data ?? 0));
           },
         },
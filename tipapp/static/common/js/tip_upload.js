@@ -5,6 +5,8 @@ let tip_upload = {
     page_size: 10,
     data: [],
     upload_files_url: "/api/upload-files/",
+    parallel_chunks: 4, // Chunks uploaded at once per file
+    chunk_retries: 5, // Attempts per chunk before the upload fails
   },
 
   init: function () {
@@ -232,11 +234,173 @@ let tip_upload = {
     progressBarContainer.empty();
   },
 
+  chunkedUploadKey: function (file) {
+    // Identifies a local file across page reloads, to resume its upload
+    return "tip_upload:" + file.name + ":" + file.size + ":" + file.lastModified;
+  },
+
+  // Starts (or resumes) a chunked upload and sends the missing chunks, a few at a time.
+  // Returns a controller with an abort() method.
+  uploadFileChunked: function (file, newFileName, onProgress, onSuccess, onError) {
+    const _ = tip_upload;
+    const csrf_token = $("#csrfmiddlewaretoken").val();
+    const chunked_url = _.var.upload_files_url + "chunked/";
+    const storageKey = _.chunkedUploadKey(file);
+    const controller = { aborted: false, xhrs: new Set(), uploadId: null };
+    const loadedPerChunk = {};
+    let doneBytes = 0;
+
+    const request = function (options) {
+      const xhr = $.ajax(
+        Object.assign({ headers: { "X-CSRFToken": csrf_token } }, options)
+      );
+      controller.xhrs.add(xhr);
+      xhr.always(() => controller.xhrs.delete(xhr));
+      return xhr;
+    };
+    const reportProgress = function () {
+      const inFlight = Object.values(loadedPerChunk).reduce((a, b) => a + b, 0);
+      onProgress(((doneBytes + inFlight) / file.size) * 100);
+    };
+    const fail = function (xhr) {
+      if (controller.aborted) return;
+      controller.aborted = true;
+      controller.xhrs.forEach((x) => x.abort());
+      onError(xhr);
+    };
+
+    const sendChunks = function (status) {
+      controller.uploadId = status.uploadId;
+      localStorage.setItem(
+        storageKey,
+        JSON.stringify({ uploadId: status.uploadId, newFileName: newFileName })
+      );
+      const missing = status.missing.slice();
+      const chunkLength = (index) =>
+        Math.min(status.chunkSize, file.size - index * status.chunkSize);
+      doneBytes = file.size - missing.reduce((a, i) => a + chunkLength(i), 0);
+      reportProgress();
+
+      let active = 0;
+      const next = function () {
+        if (controller.aborted) return;
+        if (missing.length === 0) {
+          if (active === 0) complete();
+          return;
+        }
+        const index = missing.shift();
+        active++;
+        sendChunk(index, _.var.chunk_retries, function () {
+          active--;
+          next();
+        });
+      };
+      const sendChunk = function (index, retries, done) {
+        const start = index * status.chunkSize;
+        request({
+          url: chunked_url + status.uploadId + "/chunks/" + index + "/",
+          type: "PUT",
+          data: file.slice(start, start + chunkLength(index)),
+          contentType: "application/octet-stream",
+          processData: false,
+          xhr: function () {
+            const xhr = new window.XMLHttpRequest();
+            xhr.upload.addEventListener("progress", function (evt) {
+              loadedPerChunk[index] = evt.loaded;
+              reportProgress();
+            });
+            return xhr;
+          },
+        })
+          .done(function () {
+            delete loadedPerChunk[index];
+            doneBytes += chunkLength(index);
+            reportProgress();
+            done();
+          })
+          .fail(function (xhr) {
+            delete loadedPerChunk[index];
+            if (controller.aborted) return;
+            if (retries > 0 && xhr.status !== 400) {
+              // Only this chunk is sent again
+              setTimeout(() => sendChunk(index, retries - 1, done), 1000);
+            } else {
+              fail(xhr);
+            }
+          });
+      };
+      for (let i = 0; i < _.var.parallel_chunks; i++) next();
+    };
+
+    const complete = function () {
+      request({
+        url: chunked_url + controller.uploadId + "/complete/",
+        type: "POST",
+      })
+        .done(function (response) {
+          localStorage.removeItem(storageKey);
+          onSuccess(response);
+        })
+        .fail(fail);
+    };
+
+    const start = function () {
+      request({
+        url: chunked_url,
+        type: "POST",
+        contentType: "application/json",
+        data: JSON.stringify({ fileName: newFileName, size: file.size }),
+      })
+        .done(function (response) {
+          sendChunks({
+            uploadId: response.uploadId,
+            chunkSize: response.chunkSize,
+            missing: [...Array(response.totalChunks).keys()],
+          });
+        })
+        .fail(fail);
+    };
+
+    // Resume an interrupted upload of the same file: only its missing chunks are sent
+    const saved = JSON.parse(localStorage.getItem(storageKey) || "null");
+    if (saved) {
+      newFileName = saved.newFileName;
+      request({ url: chunked_url + saved.uploadId + "/", type: "GET" })
+        .done(function (status) {
+          sendChunks({
+            uploadId: status.upload_id,
+            chunkSize: status.chunk_size,
+            missing: status.missing_chunks,
+          });
+        })
+        .fail(function () {
+          // Expired or completed meanwhile: start afresh
+          localStorage.removeItem(storageKey);
+          start();
+        });
+    } else {
+      start();
+    }
+
+    controller.abort = function () {
+      controller.aborted = true;
+      controller.xhrs.forEach((x) => x.abort());
+      localStorage.removeItem(storageKey);
+      if (controller.uploadId) {
+        $.ajax({
+          url: chunked_url + controller.uploadId + "/",
+          type: "DELETE",
+          headers: { "X-CSRFToken": csrf_token },
+        });
+      }
+    };
+    return controller;
+  },
+
   // Function for uploading files
   uploadFiles: function (files) {
-    let xhrList = [];
+    let uploadList = [];
     let completed = 0;
-    let csrf_token = $("#csrfmiddlewaretoken").val();
 
     for (let i = 0; i < files.length; i++) {
       let fileName = files[i].name;
@@ -248,14 +412,11 @@ let tip_upload = {
       $("#progressBars").append(progressBarContainer);
 
       (function (index, progressBar, progressBarContainer) {
-        const formData = new FormData();
-        formData.append("file", files[index]);
-        formData.append("newFileName", newFileName);
+        let finished = false;
 
         deleteIcon.on("click", function () {
-          if (xhrList[index] && xhrList[index].readyState !== 4) {
-            xhrList[index].abort();
-            return;
+          if (uploadList[index] && !finished) {
+            uploadList[index].abort();
           } else {
             const newFileName = $(this).attr("data-new-file-name");
             tip_upload.deleteFile(newFileName);
@@ -265,89 +426,76 @@ let tip_upload = {
           });
         });
 
-        // Upload
-        const xhr = $.ajax({
-          url: tip_upload.var.upload_files_url + "thermal_files/",
-          type: "POST",
-          headers: { "X-CSRFToken": csrf_token },
-          data: formData,
-          cache: false,
-          contentType: false,
-          processData: false,
-          xhr: function () {
-            const xhr = new window.XMLHttpRequest();
-            xhr.upload.addEventListener(
-              "progress",
-              function (evt) {
-                if (evt.lengthComputable) {
-                  const percentComplete = (evt.loaded / evt.total) * 100;
-                  // Update progressbar
-                  progressBar
-                    .find(".progress-bar")
-                    .width(percentComplete + "%");
-                  progressBar
-                    .find(".progress-bar")
-                    .attr("aria-valuenow", percentComplete);
-                  // Display percentage text
-                  progressBarContainer
-                    .find(".progress-text")
-                    .text(percentComplete.toFixed(0) + "%");
-
-                  if (percentComplete === 100) {
-                    // Change progressbar color to green
-                    deleteIcon.remove()
-                    progressBar
-                    .find(".progress-bar")
-                    .removeClass("bg-info")
-                    .addClass("bg-success");
-                    setTimeout(() => {
-                      const spinner = utils.markup(
-                        "div",
-                        [ 
-                          utils.markup("div", "", {
-                          class: "spinner-border spinner-border-sm spinn text-success",
-                          role: "status",
-                        }), {tag: "span", content: "Processing file", class: "text-success"}],
-                        { class: "d-flex gap-2 w-100" }
-                      )
-                      $(spinner).insertBefore(progressBar);
-                      progressBar.remove();
-                      
-                    }, 1000)
-                    
-                  }
-                }
-              },
-              false
-            );
-            return xhr;
-          },
-          success: function (response) {
-            progressBarContainer.fadeOut("slow", function () {
-              $(this).remove();
-            });
-            if (++completed === xhrList.length) {
-              tip_upload?.dt.draw(["page"]);
-            }
-          },
-          error: function (xhr, status, error) {
-            if (++completed === xhrList.length) {
-              tip_upload?.dt.draw(["page"]);
-            }
-            if (!xhr.responseText) return;
-            let errorResponse = JSON.parse(xhr.responseText);
-            progressBar.fadeOut("slow", function () {
-              progressBar.replaceWith(
-                $(
-                  '<span class="error-message">' +
-                    errorResponse.error +
-                    "</span>"
-                )
+        const onProgress = function (percentComplete) {
+          // Update progressbar
+          progressBar.find(".progress-bar").width(percentComplete + "%");
+          progressBar
+            .find(".progress-bar")
+            .attr("aria-valuenow", percentComplete);
+          // Display percentage text
+          progressBarContainer
+            .find(".progress-text")
+            .text(percentComplete.toFixed(0) + "%");
+
+          if (percentComplete >= 100 && !finished) {
+            finished = true;
+            // Change progressbar color to green
+            deleteIcon.remove();
+            progressBar
+              .find(".progress-bar")
+              .removeClass("bg-info")
+              .addClass("bg-success");
+            setTimeout(() => {
+              const spinner = utils.markup(
+                "div",
+                [
+                  utils.markup("div", "", {
+                    class: "spinner-border spinner-border-sm spinn text-success",
+                    role: "status",
+                  }),
+                  { tag: "span", content: "Processing file", class: "text-success" },
+                ],
+                { class: "d-flex gap-2 w-100" }
               );
-            });
-          },
-        });
-        xhrList.push(xhr);
+              $(spinner).insertBefore(progressBar);
+              progressBar.remove();
+            }, 1000);
+          }
+        };
+
+        const onSuccess = function (response) {
+          progressBarContainer.fadeOut("slow", function () {
+            $(this).remove();
+          });
+          if (++completed === uploadList.length) {
+            tip_upload?.dt.draw(["page"]);
+          }
+        };
+
+        const onError = function (xhr) {
+          finished = true;
+          if (++completed === uploadList.length) {
+            tip_upload?.dt.draw(["page"]);
+          }
+          if (!xhr.responseText) return;
+          let errorResponse = JSON.parse(xhr.responseText);
+          progressBar.fadeOut("slow", function () {
+            progressBar.replaceWith(
+              $('<span class="error-message">' + errorResponse.error + "</span>")
+            );
+          });
+        };
+
+        // Upload
+        uploadList.push(
+          tip_upload.uploadFileChunked(
+            files[index],
+            newFileName,
+            onProgress,
+            onSuccess,
+            onError
+          )
+        );
       })(i, progressBar, progressBarContainer);
     }
   },
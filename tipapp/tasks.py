@@ -2,10 +2,10 @@ import os
 import re
 import logging
 from datetime import datetime, timezone
-from pathlib import Path
 import py7zr
 
 from tipapp import settings
+from tipapp import dir_sizes
 
 logger = logging.getLogger(__name__)
 
@@ -28,15 +28,6 @@ def get_files_list(dir_path, extensions = []):
                         files_list.append({"name": file_name, "path" : entry.path , "created_at": convert_date(info.st_mtime)})
     return files_list
 
-def get_dir_size(dir_path):
-    try:
-        root_directory = Path(dir_path)
-        return sum(f.stat().st_size for f in root_directory.glob('**/*') if f.is_file())
-    except Exception as e:
-        logger.error(f"Error getting size of directory: {dir_path}")
-        logger.error(e)
-        return 0
-
 def get_thermal_files(dir_path, page, offset, search = ""):
     items = []
     index = 0
@@ -52,7 +43,8 @@ def get_thermal_files(dir_path, page, offset, search = ""):
                 is_dir = not entry.is_file()
                 item = {"name": entry_name, "path" : entry.path , "created_at": convert_date(info.st_mtime), "is_dir": is_dir }
                 if is_dir:
-                    item['size'] = get_dir_size(entry.path)
+                    # Cached size (never walked here); approximate until the import pipeline or refresh_dir_sizes_command refreshes it
+                    item['size'], item['size_approximate'] = dir_sizes.get_dir_size(entry.path, info.st_mtime_ns)
                 else:
                     item['size'] = info.st_size
                 items.append(item)
@@ -0,0 +1,319 @@
+"""
+Resumable chunked uploads.
+
+A client starts an upload with its final file name and size and gets an upload
+id and chunk size back. It then PUTs the chunks in any order, in parallel and as
+many times as needed. Each chunk is written straight to its offset in a single
+partial file, and a marker holding the chunk's SHA-256 is recorded once it is
+complete, so a retry only costs the chunks without a marker. On completion the
+partial file is hard-linked into PENDING_IMPORT_PATH under a hidden name, then
+renamed into place with RENAME_NOREPLACE: no reassembly copy, the pending folder
+never sees an incomplete archive, the watcher gets the IN_MOVED_TO it listens
+for, and an existing archive of the same name is never replaced.
+
+The upload checksum is the SHA-256 of the ordered chunk digests, computed from
+the markers without reading the file again.
+
+Chunk writes hold a shared lock on the upload and completion an exclusive one,
+so a completion never races a chunk still being written or a second completion
+(a double click, a client retry). A completed upload keeps a small record of its
+outcome until it expires, so repeating the completion returns the same result.
+"""
+# Third-Party
+import os
+import json
+import errno
+import ctypes
+import fcntl
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+# Local
+from tipapp import settings
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_EXTENSIONS = ['.zip', '.7z', '.pdf']
+READ_BLOCK_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    pass
+
+
+def get_upload_folder(upload_id):
+    # Upload ids are generated by us; anything else is rejected before touching the filesystem
+    try:
+        upload_id = uuid.UUID(hex=upload_id).hex
+    except (TypeError, ValueError):
+        raise UploadError(f"Invalid upload id: {upload_id}")
+    return os.path.join(settings.CHUNKED_UPLOADS_PATH, upload_id)
+
+
+def load_manifest(upload_id):
+    manifest_path = os.path.join(get_upload_folder(upload_id), "manifest.json")
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise UploadError(f"Unknown, expired or completed upload: {upload_id}")
+
+
+def lock_upload(upload_id, exclusive, attempts=1):
+    """
+    Takes the upload's lock, shared (chunk writes) or exclusive (completion), trying `attempts` times
+    a fifth of a second apart rather than blocking the worker. Returns the file descriptor to close to release it.
+    """
+    try:
+        fd = os.open(os.path.join(get_upload_folder(upload_id), "lock"), os.O_RDWR | os.O_CREAT)
+    except FileNotFoundError:
+        raise UploadError(f"Unknown or expired upload: {upload_id}")
+    for attempt in range(attempts):
+        try:
+            fcntl.flock(fd, (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | fcntl.LOCK_NB)
+            return fd
+        except BlockingIOError:
+            if attempt < attempts - 1:
+                time.sleep(0.2)
+    os.close(fd)
+    if exclusive:
+        raise UploadError("Chunks are still being written or the upload is being completed, try again.")
+    raise UploadError("The upload is being completed.")
+
+
+def get_chunk_length(manifest, index):
+    if index < 0 or index >= manifest["total_chunks"]:
+        raise UploadError(f"Chunk {index} out of range (0-{manifest['total_chunks'] - 1}).")
+    start = index * manifest["chunk_size"]
+    return min(manifest["chunk_size"], manifest["size"] - start)
+
+
+def init_upload(file_name, size, user=""):
+    """
+    Starts a chunked upload of file_name (its final name in PENDING_IMPORT_PATH). Returns its manifest.
+    """
+    _, file_extension = os.path.splitext(file_name)
+    if file_name != os.path.basename(file_name) or file_name.startswith(".") or file_extension.lower() not in ALLOWED_EXTENSIONS:
+        raise UploadError("Invalid file name. Only .zip, .7z and .pdf files are allowed.")
+    if size <= 0:
+        raise UploadError("Invalid file size.")
+    if os.path.exists(os.path.join(settings.PENDING_IMPORT_PATH, file_name)):
+        raise UploadError(f"File [{file_name}] already exists.")
+
+    cleanup_expired_uploads()
+
+    chunk_size = settings.CHUNKED_UPLOAD_CHUNK_SIZE
+    upload_id = uuid.uuid4().hex
+    manifest = {
+        "upload_id": upload_id,
+        "file_name": file_name,
+        "size": size,
+        "chunk_size": chunk_size,
+        "total_chunks": (size + chunk_size - 1) // chunk_size,
+        "user": user,
+        "created": time.time(),
+    }
+    upload_folder = get_upload_folder(upload_id)
+    os.makedirs(upload_folder)
+    # Sparse file of the final size; chunks are written at their offsets
+    with open(os.path.join(upload_folder, "data.partial"), 'wb') as f:
+        f.truncate(size)
+    with open(os.path.join(upload_folder, "manifest.json"), 'w') as f:
+        json.dump(manifest, f)
+    logger.info(f"Chunked upload {upload_id} started for [{file_name}] ({size} bytes, {manifest['total_chunks']} chunks).")
+    return manifest
+
+
+def write_chunk(upload_id, index, stream, expected_checksum=None):
+    """
+    Writes chunk `index` from a file-like stream at its offset, then records its marker.
+    Returns the chunk's SHA-256.
+    """
+    lock = lock_upload(upload_id, exclusive=False)
+    try:
+        return _write_chunk(upload_id, index, stream, expected_checksum)
+    finally:
+        os.close(lock)
+
+
+def _write_chunk(upload_id, index, stream, expected_checksum):
+    manifest = load_manifest(upload_id)
+    length = get_chunk_length(manifest, index)
+    upload_folder = get_upload_folder(upload_id)
+
+    digest = hashlib.sha256()
+    received = 0
+    fd = os.open(os.path.join(upload_folder, "data.partial"), os.O_WRONLY)
+    try:
+        offset = index * manifest["chunk_size"]
+        while received < length:
+            block = stream.read(min(READ_BLOCK_SIZE, length - received))
+            if not block:
+                break
+            os.pwrite(fd, block, offset + received)
+            digest.update(block)
+            received += len(block)
+        if received != length or stream.read(1):
+            raise UploadError(f"Chunk {index} must be exactly {length} bytes.")
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+    checksum = digest.hexdigest()
+    if expected_checksum and expected_checksum.lower() != checksum:
+        raise UploadError(f"Checksum mismatch for chunk {index}.")
+
+    marker_path = os.path.join(upload_folder, f"{index:06d}.done")
+    tmp_path = marker_path + f".{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(checksum)
+    os.replace(tmp_path, marker_path)
+    return checksum
+
+
+def get_received_chunks(upload_id):
+    """
+    Returns {chunk index: SHA-256} of the complete chunks.
+    """
+    received = {}
+    for name in os.listdir(get_upload_folder(upload_id)):
+        if name.endswith(".done"):
+            with open(os.path.join(get_upload_folder(upload_id), name)) as f:
+                received[int(name[:-len(".done")])] = f.read().strip()
+    return received
+
+
+def get_upload_status(upload_id):
+    manifest = load_manifest(upload_id)
+    received = get_received_chunks(upload_id)
+    missing = [index for index in range(manifest["total_chunks"]) if index not in received]
+    return {
+        "upload_id": upload_id,
+        "file_name": manifest["file_name"],
+        "size": manifest["size"],
+        "chunk_size": manifest["chunk_size"],
+        "total_chunks": manifest["total_chunks"],
+        "received_chunks": sorted(received),
+        "missing_chunks": missing,
+    }
+
+
+def get_upload_checksum(chunk_checksums):
+    # SHA-256 of the ordered chunk digests
+    digest = hashlib.sha256()
+    for checksum in chunk_checksums:
+        digest.update(bytes.fromhex(checksum))
+    return digest.hexdigest()
+
+
+def complete_upload(upload_id, expected_checksum=None):
+    """
+    Moves the assembled file into PENDING_IMPORT_PATH once every chunk has been received.
+    Returns (file name, checksum, completed now): repeating the completion of a completed upload returns its outcome.
+    """
+    # Waits a little for a concurrent completion (double click, client retry), then returns its outcome
+    lock = lock_upload(upload_id, exclusive=True, attempts=10)
+    try:
+        return _complete_upload(upload_id, expected_checksum)
+    finally:
+        os.close(lock)
+
+
+def _complete_upload(upload_id, expected_checksum):
+    upload_folder = get_upload_folder(upload_id)
+    completed_path = os.path.join(upload_folder, "completed.json")
+    if os.path.exists(completed_path):
+        with open(completed_path) as f:
+            completed = json.load(f)
+        return completed["file_name"], completed["checksum"], False
+
+    manifest = load_manifest(upload_id)
+    received = get_received_chunks(upload_id)
+    missing = [index for index in range(manifest["total_chunks"]) if index not in received]
+    if missing:
+        raise UploadError(f"{len(missing)} chunk(s) missing: {missing[:20]}")
+
+    checksum = get_upload_checksum(received[index] for index in range(manifest["total_chunks"]))
+    if expected_checksum and expected_checksum.lower() != checksum:
+        raise UploadError("Upload checksum mismatch.")
+
+    place_file(os.path.join(upload_folder, "data.partial"), os.path.join(settings.PENDING_IMPORT_PATH, manifest["file_name"]))
+
+    # Outcome kept until the upload expires; the chunk data is gone, so the upload cannot be written to again
+    with open(completed_path, 'w') as f:
+        json.dump({"file_name": manifest["file_name"], "checksum": checksum}, f)
+    for name in os.listdir(upload_folder):
+        if name not in ("completed.json", "lock"):
+            os.remove(os.path.join(upload_folder, name))
+    logger.info(f"Chunked upload {upload_id} completed: [{manifest['file_name']}] (checksum {checksum}).")
+    return manifest["file_name"], checksum, True
+
+
+_libc = ctypes.CDLL(None, use_errno=True)
+AT_FDCWD = -100
+RENAME_NOREPLACE = 1
+
+
+def rename_noreplace(source_path, dest_path):
+    """
+    Renames source_path to dest_path, raising FileExistsError rather than replacing an existing file.
+    """
+    try:
+        renameat2 = _libc.renameat2
+    except AttributeError:
+        # glibc < 2.28
+        renameat2 = None
+    if renameat2 is not None:
+        if renameat2(AT_FDCWD, os.fsencode(source_path), AT_FDCWD, os.fsencode(dest_path), RENAME_NOREPLACE) == 0:
+            return
+        error = ctypes.get_errno()
+        if error not in (errno.ENOSYS, errno.EINVAL):
+            raise OSError(error, os.strerror(error), dest_path)
+    # Flag not supported by the kernel or filesystem: checked rename, with a tiny window between the check and the rename
+    if os.path.lexists(dest_path):
+        raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), dest_path)
+    os.rename(source_path, dest_path)
+
+
+def place_file(source_path, dest_path):
+    """
+    Moves source_path to dest_path, never replacing an existing file.
+    The file first gets a hidden name next to dest_path and is then renamed into place, so the
+    watcher (watch_imports_command) sees it arrive complete, as an IN_MOVED_TO event.
+    """
+    dest_folder, dest_name = os.path.split(dest_path)
+    temp_path = os.path.join(dest_folder, f".{dest_name}.{uuid.uuid4().hex}.part")
+    try:
+        # No copy on the same filesystem (CHUNKED_UPLOADS_PATH is inside PENDING_IMPORT_PATH by default)
+        os.link(source_path, temp_path)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        # Different filesystems: copy into a file only we can have created
+        with open(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644), 'wb') as dest, open(source_path, 'rb') as source:
+            shutil.copyfileobj(source, dest, READ_BLOCK_SIZE)
+    try:
+        rename_noreplace(temp_path, dest_path)
+    except FileExistsError:
+        raise UploadError(f"File [{dest_name}] already exists.")
+    finally:
+        if os.path.lexists(temp_path):
+            os.remove(temp_path)
+    os.remove(source_path)
+
+
+def abort_upload(upload_id):
+    shutil.rmtree(get_upload_folder(upload_id), ignore_errors=True)
+
+
+def cleanup_expired_uploads():
+    # Removes the uploads not touched for CHUNKED_UPLOAD_EXPIRY_HOURS
+    if not os.path.exists(settings.CHUNKED_UPLOADS_PATH):
+        return
+    expiry = time.time() - settings.CHUNKED_UPLOAD_EXPIRY_HOURS * 3600
+    for entry in os.scandir(settings.CHUNKED_UPLOADS_PATH):
+        if entry.is_dir() and entry.stat().st_mtime < expiry:
+            logger.info(f"Removing expired chunked upload: {entry.name}")
+            shutil.rmtree(entry.path, ignore_errors=True)
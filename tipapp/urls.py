@@ -48,6 +48,10 @@ urlpatterns = [
     urls.path("uploads-history", views.UploadsHistoryView.as_view(), name="uploads-history"),
     
     urls.path("api/upload-files/thermal_files/", views.api_upload_thermal_files),
+    urls.path("api/upload-files/chunked/", views.api_chunked_upload_init),
+    urls.path("api/upload-files/chunked/<str:upload_id>/", views.api_chunked_upload_status),
+    urls.path("api/upload-files/chunked/<str:upload_id>/chunks/<int:index>/", views.api_chunked_upload_chunk),
+    urls.path("api/upload-files/chunked/<str:upload_id>/complete/", views.api_chunked_upload_complete),
     urls.path("api/upload-files/list_pending_imports/", views.list_pending_imports),
     urls.path("api/upload-files/api_delete_thermal_file/", views.api_delete_thermal_file),
     urls.path("api/thermal-files/list_thermal_folder_contents/", views.list_thermal_folder_contents),
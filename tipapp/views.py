@@ -5,11 +5,11 @@
 import os
 import logging
 import io
-import zipfile
 
 from django import http
 from django import shortcuts
-from django.http import JsonResponse, FileResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
 from django.views.generic import base
 from django.contrib import auth
 from django.core.paginator import Paginator
@@ -23,6 +23,9 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 # Internal
 from tipapp import settings
 from tipapp.tasks import get_files_list, get_file_record, get_thermal_files
+from tipapp import jobs
+from tipapp import uploads
+from tipapp.downloads import iter_zip_directory, serve_file
 from tipapp.permissions import IsInAdministratorsGroup, IsInAdminOrOfficersGroup, IsInOfficersGroup
 
 # Typing
@@ -205,12 +208,67 @@ def api_upload_thermal_files(request, *args, **kwargs):
             for chunk in uploaded_file.chunks():
                 destination.write(chunk)
         logger.info(f"File: [{uploaded_file.name}] has been successfully saved at [{save_path}].")
+        if settings.IMPORT_QUEUE_ENABLED and jobs.is_import_archive(newFileName):
+            # Picked up by the import worker within seconds
+            jobs.enqueue_import(newFileName)
         file_info = get_file_record(settings.PENDING_IMPORT_PATH, newFileName)
         return JsonResponse({'message': 'File(s) uploaded successfully.', 'data' : file_info})
     else:
         logger.info(f"No file(s) were uploaded.")
         return JsonResponse({'error': 'No file(s) were uploaded.'}, status=400)
 
+@api_view(["POST"])
+@permission_classes([IsInAdministratorsGroup])
+def api_chunked_upload_init(request, *args, **kwargs):
+    # Body: {"fileName": final name in the pending imports folder, "size": bytes}
+    try:
+        manifest = uploads.init_upload(str(request.data.get('fileName', '')), int(request.data.get('size', 0)), request.user.username)
+    except (uploads.UploadError, ValueError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({
+        'uploadId': manifest['upload_id'],
+        'chunkSize': manifest['chunk_size'],
+        'totalChunks': manifest['total_chunks'],
+    })
+
+@api_view(["PUT"])
+@permission_classes([IsInAdministratorsGroup])
+def api_chunked_upload_chunk(request, upload_id, index, *args, **kwargs):
+    # Raw chunk bytes in the body, read as they arrive; optional X-Chunk-Checksum header (SHA-256 hex)
+    try:
+        checksum = uploads.write_chunk(upload_id, index, request.stream or io.BytesIO(), request.headers.get('X-Chunk-Checksum'))
+    except uploads.UploadError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'index': index, 'checksum': checksum})
+
+@api_view(["GET", "DELETE"])
+@permission_classes([IsInAdministratorsGroup])
+def api_chunked_upload_status(request, upload_id, *args, **kwargs):
+    try:
+        if request.method == "DELETE":
+            uploads.abort_upload(upload_id)
+            return JsonResponse({'message': 'Upload cancelled.'})
+        return JsonResponse(uploads.get_upload_status(upload_id))
+    except uploads.UploadError as e:
+        return JsonResponse({'error': str(e)}, status=404)
+
+@api_view(["POST"])
+@permission_classes([IsInAdministratorsGroup])
+def api_chunked_upload_complete(request, upload_id, *args, **kwargs):
+    # Optional body: {"checksum": SHA-256 hex of the ordered chunk SHA-256 digests}
+    try:
+        file_name, checksum, completed_now = uploads.complete_upload(upload_id, request.data.get('checksum'))
+    except uploads.UploadError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if not completed_now:
+        # Repeated completion (double click, client retry): the archive may already have been processed
+        return JsonResponse({'message': 'File uploaded successfully.', 'checksum': checksum})
+    if settings.IMPORT_QUEUE_ENABLED and jobs.is_import_archive(file_name):
+        # Picked up by the import worker within seconds
+        jobs.enqueue_import(file_name)
+    file_info = get_file_record(settings.PENDING_IMPORT_PATH, file_name)
+    return JsonResponse({'message': 'File uploaded successfully.', 'checksum': checksum, 'data': file_info})
+
 @api_view(["POST"])
 @permission_classes([IsInAdministratorsGroup])
 def api_delete_thermal_file(request, *args, **kwargs):
@@ -223,29 +281,6 @@ def api_delete_thermal_file(request, *args, **kwargs):
         return JsonResponse({'error': f'File [{file_name}] does not exist.'}, status=400)
 
 
-def zip_directory_in_memory(full_path: str) -> io.BytesIO:
-    """
-    Zips a directory and returns it as an in-memory BytesIO object.
-    This avoids creating temporary files on disk.
-    """
-    # Create an in-memory binary stream
-    buffer = io.BytesIO()
-
-    # Use a 'with' statement to ensure the zip file is properly finalized (closed)
-    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
-        for root, dirs, files in os.walk(full_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                # Calculate the relative path to be used inside the zip archive
-                arcname = os.path.relpath(file_path, start=full_path)
-                zf.write(file_path, arcname)
-
-    # Rewind the buffer's position to the beginning
-    buffer.seek(0)
-    
-    return buffer
-
-
 @api_view(["GET"])
 @permission_classes([IsInAdminOrOfficersGroup])
 def api_download_thermal_file_or_folder(request, *args, **kwargs):
@@ -299,30 +334,24 @@ def api_download_thermal_file_or_folder(request, *args, **kwargs):
 
         if os.path.isdir(target_path):
             # --- Logic for FOLDER download ---
-            logger.info(f"Target is a directory. Zipping in memory: {target_path}")
-            
-            # Use the helper function to zip the directory in memory.
-            file_buffer = zip_directory_in_memory(target_path)
-            
-            # Create a FileResponse with the zipped content.
-            response = FileResponse(file_buffer, as_attachment=True, filename=f"{download_filename}.zip")
-            response["Content-Type"] = "application/zip"
+            logger.info(f"Target is a directory. Streaming it as a zip: {target_path}")
+            download_filename = f"{download_filename}.zip"
+
+            # The zip is produced as the response is sent, so memory stays flat whatever the folder size.
+            response = StreamingHttpResponse(iter_zip_directory(target_path), content_type="application/zip")
+            response["Content-Disposition"] = content_disposition_header(True, download_filename)
             
         else: # The path points to a single FILE
             # --- Logic for FILE download ---
             logger.info(f"Target is a file. Serving directly: {target_path}")
-            
-            # Open the file in binary read mode.
-            file_handle = open(target_path, 'rb')
-            
-            # Create a FileResponse with the file content.
-            response = FileResponse(file_handle, as_attachment=True, filename=download_filename)
-            response["Content-Type"] = "application/octet-stream"
+
+            # Honours Range and conditional requests, or hands the transfer to the front-end server.
+            response = serve_file(request, target_path, download_filename)
 
         # This header is required for the frontend to be able to read the filename from the response.
         response["Access-Control-Expose-Headers"] = "Content-Disposition"
         
-        logger.info(f"Successfully prepared download for {response.filename}")
+        logger.info(f"Successfully prepared download for {download_filename}")
         return response
 
     except Exception as e: